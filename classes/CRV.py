@@ -2,193 +2,252 @@ from classes.utils import *
 
 ################ Composite Representation Vectors ################
 #
-# - Stores a dict of words and co-occurrence frequencies
+# - Stores words and co-occurrence frequencies, as sorted int32 word ids and float32 values
+#   (word ids come from one vocabulary shared by every CRV, so CRVs from anywhere can be combined)
 # - prints them in clean format
-# - Performs operations on these dicts (add, sum, div, etc.)
+# - Performs operations on them (add, sum, div, etc.) by merging their sorted ids
+# - Only sorts itself by size when it's printed, plotted or iterated over
+
+
+# every word a CRV has used; a CRV only stores the ids of its words
+CRV_VOCAB = []
+CRV_INDICES = {}
+
+def get_crv_ids(words):
+    ids = array('i')
+    for word in words:
+        index = CRV_INDICES.get(word)
+        if index is None:
+            index = CRV_INDICES[word] = len(CRV_VOCAB)
+            CRV_VOCAB.append(word)
+        ids.append(index)
+
+    return np.frombuffer(ids, dtype = np.int32)
+
 
 class CRV:
-    
+
     PRINT_CUTOFF_AMT = 20
     PRINT_ROUND_DIGITS = 2
 
-    
+    __slots__ = ('ids', 'vals', '_order')
+
     def __init__(self, values):
-        self.vals = sort_abs_hl(values)
+        values = dict(values)
+        self.set_arrays(get_crv_ids(values.keys()), np.fromiter(values.values(), dtype = np.float32, count = len(values)))
+
+    # ids don't need to be sorted or unique (repeats are added together)
+    @classmethod
+    def from_arrays(cls, ids, values):
+        crv = cls.__new__(cls)
+        crv.set_arrays(np.asarray(ids, dtype = np.int32), np.asarray(values, dtype = np.float32))
+        return crv
+
+    def set_arrays(self, ids, values):
+        if len(ids) > 1 and np.any(ids[1:] <= ids[:-1]):
+            ids, inverse = np.unique(ids, return_inverse = True)
+            values = np.bincount(inverse, weights = values, minlength = len(ids)).astype(np.float32)
+
+        self.ids = ids
+        self.vals = values
+        self._order = None
+
+    def with_values(self, values):
+        return CRV.from_arrays(self.ids, values)
+
+    # positions of the values from largest to smallest size (ties by word), only worked out when needed
+    @property
+    def order(self):
+        if self._order is None:
+            words, values = self.words(), self.vals.tolist()
+            self._order = sorted(range(len(words)), key = lambda i: (-abs(values[i]), words[i]))
+        return self._order
+
+    def words(self):
+        return [CRV_VOCAB[i] for i in self.ids.tolist()]
+
+    # CRVs pickle as plain dicts, since word ids differ between processes
+    def __reduce__(self):
+        return (CRV, (dict(zip(self.words(), self.vals.tolist())),))
 
 
     # Plotting
 
     def plot(self, mode = 'pie', start = 0, length = 20):
-        plot_dict(sort_abs_hl(self.vals), mode = mode, start = start, length = length)
-        
+        plot_dict(dict(self.items()), mode = mode, start = start, length = length)
+
 
     # Dunder methods
-    
+
     def asdict(self):
-        return dict(self.vals)
-    
+        return dict(self.items())
+
+    def __len__(self):
+        return len(self.ids)
+
     def __iter__(self):
         for key in self.keys():
             yield key
 
     def min(self, other):
-        if type(other) in (int, float):
-            return {k : min(v, other) for k, v in self.items()}
+        if is_scalar(other):
+            return self.with_values(np.minimum(self.vals, other))
         else:
-            return {k : min(self[k], other[k]) for k in set(self.keys()).intersection(other.keys())}
-    
+            ids, values, other_values = self._intersect(other)
+            return CRV.from_arrays(ids, np.minimum(values, other_values))
+
     def __abs__(self):
-        return CRV(self._abs(self.asdict()))
-    
-    def _abs(self, d):
-        return {key : abs(value) for key, value in d.items()}
-    
-    def _add(self, d, d2):
-        return {key : d.get(key, 0) + d2.get(key, 0) for key in set(d.keys()).union(d2.keys())}
-    
-    def _sadd(self, d, s):
-        return {key : value + s for key, value in d.items()}
-    
-    def _sub(self, d, d2):
-        return {key : d.get(key, 0) - d2.get(key, 0) for key in set(d.keys()).union(d2.keys())}
-    
-    def _ssub(self, d, s):
-        return {key : value - s for key, value in d.items()}
-    
-    def _rsub(self, d, d2):
-        return self._sub(d2, d)
-    
-    def _rssub(self, d, s):
-        return {key : s - value for key, value in d.items()}
-    
-    def _mul(self, d, d2):
-        return {key : d[key] * d2[key] for key in set(d.keys()).intersection(d2.keys())}
-    
-    def _smul(self, d, s):
-        return {key : value * s for key, value in d.items()}
-    
-    def _div(self, d, d2):
-        return {key : d[key] / d2[key] for key in set(d.keys()).intersection(d2.keys())}
-    
-    def _sdiv(self, d, s):
-        return {key : value / s for key, value in d.items()}
-    
-    def _rdiv(self, d, d2):
-        return self._div(d2, d)
-    
-    def _rsdiv(self, d, s):
-        return {key : s / value for key, value in d.items()}
-    
-    def _pow(self, d, d2):
-        return {key : d[key] ** d2[key] for key in set(d.keys()).union(d2.keys())}
-    
-    def _spow(self, d, s):
-        return {key : value ** s for key, value in d.items()}
-    
-    def _rpow(self, d, d2):
-        return self._pow(d2, d)
-    
-    def _rspow(self, d, s):
-        return {key : s ** value for key, value in d.items()}
-
-    
+        return self.with_values(abs(self.vals))
+
+    # merges of sorted ids: every id in either CRV, or only the ids in both, with both CRVs' values lined up
+    def _union(self, other):
+        other = to_crv(other)
+        ids = np.union1d(self.ids, other.ids)
+        values, other_values = np.zeros(len(ids), dtype = np.float32), np.zeros(len(ids), dtype = np.float32)
+        values[np.searchsorted(ids, self.ids)] = self.vals
+        other_values[np.searchsorted(ids, other.ids)] = other.vals
+        return ids, values, other_values
+
+    def _intersect(self, other):
+        other = to_crv(other)
+        ids, positions, other_positions = np.intersect1d(self.ids, other.ids, assume_unique = True, return_indices = True)
+        return ids, self.vals[positions], other.vals[other_positions]
+
+
     def __add__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._sadd(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(self.vals + other)
         else:
-            return CRV(self._add(self.vals, dict(other)))
+            ids, values, other_values = self._union(other)
+            return CRV.from_arrays(ids, values + other_values)
+
 
-    
     def __sub__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._ssub(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(self.vals - other)
         else:
-            return CRV(self._sub(self.vals, dict(other)))
+            ids, values, other_values = self._union(other)
+            return CRV.from_arrays(ids, values - other_values)
 
     def __rsub__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._rssub(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(other - self.vals)
         else:
-            return CRV(self._rsub(self.vals, dict(other)))
+            ids, values, other_values = self._union(other)
+            return CRV.from_arrays(ids, other_values - values)
+
 
-    
     def __mul__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._smul(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(self.vals * other)
         else:
-            return CRV(self._mul(self.vals, dict(other)))
+            ids, values, other_values = self._intersect(other)
+            return CRV.from_arrays(ids, values * other_values)
+
 
-    
     def __truediv__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._sdiv(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(self.vals / other)
         else:
-            return CRV(self._div(self.vals, dict(other)))
-        
+            ids, values, other_values = self._intersect(other)
+            return CRV.from_arrays(ids, values / other_values)
+
     def __rtruediv__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._rsdiv(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(other / self.vals)
         else:
-            return CRV(self._rdiv(self.vals, dict(other)))
+            ids, values, other_values = self._intersect(other)
+            return CRV.from_arrays(ids, other_values / values)
+
 
-    
+    # (a word missing from either side has nothing to raise, so only shared words are kept)
     def __pow__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._spow(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(self.vals ** other)
         else:
-            return CRV(self._pow(self.vals, dict(other)))
-        
+            ids, values, other_values = self._intersect(other)
+            return CRV.from_arrays(ids, values ** other_values)
+
     def __rpow__(self, other):
-        if type(other) in (int, float):
-            return CRV(self._rspow(self.vals, other))
+        if is_scalar(other):
+            return self.with_values(other ** self.vals)
         else:
-            return CRV(self._rpow(self.vals, dict(other)))
+            ids, values, other_values = self._intersect(other)
+            return CRV.from_arrays(ids, other_values ** values)
 
 
 
     __radd__ = __add__
     __rmul__ = __mul__
 
-    
+
     # Get and Set
-    
+
+    # position of a word in the ids, or None
+    def _find(self, key):
+        index = CRV_INDICES.get(key)
+        if index is None:
+            return None
+        position = int(np.searchsorted(self.ids, index))
+        return position if position < len(self.ids) and self.ids[position] == index else None
+
     def __getitem__(self, index):
-        return self.vals.get(index, 0)
+        position = self._find(index)
+        return 0 if position is None else float(self.vals[position])
 
     def __setitem__(self, index, value):
-        self.vals[index] = value
+        position = self._find(index)
+        if position is not None:
+            self.vals = self.vals.copy()
+            self.vals[position] = value
+            self._order = None
+        else:
+            self.set_arrays(np.append(self.ids, get_crv_ids([index])), np.append(self.vals, np.float32(value)))
 
     def pop(self, key):
-        return self.vals.pop(key, None)
+        position = self._find(key)
+        if position is None:
+            return None
+
+        value = float(self.vals[position])
+        self.set_arrays(np.delete(self.ids, position), np.delete(self.vals, position))
+        return value
 
     def items(self):
-        return self.vals.items()
-    
+        words, values = self.words(), self.vals.tolist()
+        return [(words[i], values[i]) for i in self.order]
+
     def keys(self):
-        return self.vals.keys()
-    
+        return [key for key, _ in self.items()]
+
     def values(self):
-        return self.vals.values()
+        return [value for _, value in self.items()]
 
 
     # Printing
-    
+
     def __repr__(self):
-        
+
         repr_string = ''
         cutoff = self.PRINT_CUTOFF_AMT
-        
+
         for key, val in self.items():
             repr_string += f' {'+' if val >= 0 else '-'} \033[94m{abs(round(val, self.PRINT_ROUND_DIGITS))}\033[37m\u22C5\033[92m{'\\n' if key == '\n' else key}\033[37m'
             cutoff -= 1
 
-            if cutoff == 0 and len(self.items()) != self.PRINT_CUTOFF_AMT:
-                repr_string += f' + \033[96m{len(self.items()) - self.PRINT_CUTOFF_AMT}\033[37m \033[31mothers\033[37m'
+            if cutoff == 0 and len(self) != self.PRINT_CUTOFF_AMT:
+                repr_string += f' + \033[96m{len(self) - self.PRINT_CUTOFF_AMT}\033[37m \033[31mothers\033[37m'
                 break
 
         return '{' + repr_string + '}'
-    
+
     def print_full(self):
         for key, val in self.items():
             print(f'{'+' if val >= 0 else '-'} \033[94m{abs(round(val, self.PRINT_ROUND_DIGITS))}\033[37m\u22C5\033[92m{'\\n' if key == '\n' else key}\033[37m')
-            
\ No newline at end of file
+
+
+def is_scalar(value):
+    return isinstance(value, (int, float, np.number))
+
+def to_crv(value):
+    return value if isinstance(value, CRV) else CRV(value)
\ No newline at end of file
@@ -0,0 +1,124 @@
+import scipy.sparse
+import numpy as np
+
+from classes.utils import *
+from classes.crv import *
+from classes.vectorizer import *
+
+################ The CRVCollection Class ################
+#
+# - Stacks many CRVs into one sparse matrix (a row per CRV), on the context words they use between them
+# - Sums, means, weighted means, and elementwise mins / maxes of every CRV at once, as one CRV
+# - Rates every CRV in the collection against every other
+# - Gives back single CRVs only when they're asked for
+# - Can be made straight from a Vectorizer's rows, so the centroid of a group of words
+#   (all the country names, all the units of measurement...) is one call:
+#     CRVCollection.from_vectorizer(vectorizer, ['england', 'france', 'germany']).mean()
+
+
+class CRVCollection:
+
+    # crvs can be a list of CRVs (named 0, 1, 2... unless names are given), or a dict of name : CRV
+    def __init__(self, crvs, names = None):
+        if isinstance(crvs, dict):
+            names, crvs = list(crvs.keys()), list(crvs.values())
+        crvs = [to_crv(crv) for crv in crvs]
+
+        ids = np.concatenate([np.zeros(0, dtype = np.int32)] + [crv.ids for crv in crvs])
+        values = np.concatenate([np.zeros(0, dtype = np.float32)] + [crv.vals for crv in crvs])
+        indptr = np.concatenate([[0], np.cumsum([len(crv) for crv in crvs], dtype = np.int64)])
+
+        # each CRV's ids are sorted, so its columns come out sorted too
+        self.ids = np.unique(ids)
+        self.matrix = scipy.sparse.csr_matrix((values, np.searchsorted(self.ids, ids), indptr), shape = (len(crvs), len(self.ids)))
+        self.names = list(range(len(crvs))) if names is None else list(names)
+
+        if len(self.names) != len(crvs):
+            raise Exception(f'A CRVCollection of {len(crvs)} CRVs was given {len(self.names)} names')
+
+    # a collection of already stacked rows, with the CRV word id of each column
+    @classmethod
+    def from_matrix(cls, matrix, ids, names = None):
+        collection = cls.__new__(cls)
+        collection.ids = np.asarray(ids, dtype = np.int32)
+        collection.matrix = scipy.sparse.csr_matrix(matrix)
+        collection.names = list(range(matrix.shape[0])) if names is None else list(names)
+        return collection
+
+    # the rows of some of a Vectorizer's words, without making a CRV for each of them
+    @classmethod
+    def from_vectorizer(cls, vectorizer, words):
+        words = list(words)
+        rows = vectorizer.dequantize(vectorizer.matrix[[vectorizer.to_int(word) for word in words]])
+        return cls.from_matrix(rows, vectorizer.crv_ids, [vectorizer.to_str(word) for word in words])
+
+    @property
+    def words(self):
+        return [CRV_VOCAB[i] for i in self.ids.tolist()]
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # a CRV by its position, or by its name
+    def __getitem__(self, index):
+        if not isinstance(index, (int, np.integer)):
+            index = self.names.index(index)
+
+        start, end = self.matrix.indptr[index], self.matrix.indptr[index + 1]
+        return CRV.from_arrays(self.ids[self.matrix.indices[start : end]], self.matrix.data[start : end])
+
+    def to_CRVs(self):
+        return dict(zip(self.names, self))
+
+    # a Vectorizer with a row per CRV, to rate words against the collection with
+    def to_vectorizer(self):
+        return Vectorizer(list(self.names), self.matrix.copy(), self.words)
+
+    # a vector over the collection's columns, as a CRV (zeros left out)
+    def to_CRV(self, vector):
+        vector = np.asarray(vector).ravel()
+        nonzero = np.flatnonzero(vector)
+        return CRV.from_arrays(self.ids[nonzero], vector[nonzero])
+
+
+    # Combining
+
+    # weights are one number per CRV
+    def sum(self, weights = None):
+        if weights is None:
+            return self.to_CRV(self.matrix.sum(axis = 0))
+        return self.to_CRV(self.matrix.T @ np.asarray(weights, dtype = np.float64))
+
+    def mean(self, weights = None):
+        if weights is None:
+            return self.sum() / len(self)
+        return self.sum(weights) / float(np.sum(weights))
+
+    # a CRV without a word counts as a 0 for it, like CRV.min only keeping the words every CRV has
+    def min(self):
+        return self.to_CRV(self.matrix.min(axis = 0).toarray())
+
+    def max(self):
+        return self.to_CRV(self.matrix.max(axis = 0).toarray())
+
+
+    # Comparing
+
+    # every CRV rated against every other, as a (CRVs x CRVs) array, in any of the Vectorizer's modes
+    def similarity(self, mode = 'min'):
+        if mode == 'mult':
+            return (self.matrix @ self.matrix.T).toarray()
+
+        # with no negative values sqrt(a * b) is sqrt(a) * sqrt(b), like in Vectorizer.similarity_graph
+        if mode == 'sqrt' and (self.matrix.nnz == 0 or self.matrix.data.min() >= 0):
+            roots = self.matrix.sqrt()
+            return (roots @ roots.T).toarray() ** 2
+
+        return self.to_vectorizer().rate_rows_batch(self.matrix, self.matrix.toarray(), mode)
+
+    def __repr__(self):
+        return f'CRVCollection of {len(self)} CRVs on {len(self.ids)} words'
\ No newline at end of file
@@ -0,0 +1,96 @@
+import numpy as np
+import hashlib
+import shutil
+import json
+import os
+
+from classes.utils import *
+from classes.vectorizer import *
+
+################ Artifact Cache ################
+#
+# - Keeps cleaned corpora and vectorizers on disk, so they don't have to be rebuilt every session
+# - Files are named by a hash of the source file's contents plus every option used to build them,
+#   so changing the data or an option never loads a stale result
+# - Corpus arrays are stored uncompressed in .npz files, everything else (word lists, etc.) as json inside them
+# - Vectorizers are stored as folders that are memory mapped when loaded
+
+
+# bump this when what gets stored (or how it's built) changes, so old cache files are ignored
+CACHE_VERSION = 2
+
+def hash_file(filepath, chunk_size = 1 << 20):
+    file_hash = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+# parts must be json serializable
+def get_cache_key(*parts):
+    return hashlib.sha256(json.dumps([CACHE_VERSION, *parts]).encode('utf-8')).hexdigest()[:32]
+
+def get_cache_path(cache, kind, key):
+    return os.path.join(cache, f'{kind}_{key}')
+
+# arrays is a dict of numpy arrays, values a dict of anything json serializable
+# saved as filepath + '.npz'
+def save_arrays(filepath, arrays, values):
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok = True)
+
+    # written to a temporary file first, so an interrupted save never leaves a broken cache file
+    temp_path = filepath + '.tmp.npz'
+    np.savez(temp_path, **arrays, values = np.array(json.dumps(values)))
+    os.replace(temp_path, filepath + '.npz')
+
+# returns (arrays, values), or None if nothing was cached
+def load_arrays(filepath):
+    if not os.path.exists(filepath + '.npz'):
+        return None
+
+    with np.load(filepath + '.npz') as data:
+        arrays = {name : data[name] for name in data.files if name != 'values'}
+        values = json.loads(str(data['values']))
+
+    return arrays, values
+
+
+# small json files (written the same safe way)
+
+def save_json(filepath, value):
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok = True)
+    temp_path = filepath + '.tmp'
+    with open(temp_path, 'w', encoding = 'utf-8') as f:
+        json.dump(value, f)
+    os.replace(temp_path, filepath)
+
+def load_json(filepath, default = None):
+    if not os.path.exists(filepath):
+        return default
+    with open(filepath, encoding = 'utf-8') as f:
+        return json.load(f)
+
+# sentence hashes (16 byte digests) as one (n x 16) byte array
+def hashes_to_array(hashes):
+    return np.frombuffer(b''.join(hashes), dtype = np.uint8).reshape(-1, 16)
+
+def hashes_from_array(array):
+    return set(array.view('V16').ravel().tolist())
+
+
+# vectorizers are saved as folders (see Vectorizer.save), written under a temporary name and then renamed
+def save_vectorizer(vectorizer, path):
+    temp_path = path + '.tmp'
+    shutil.rmtree(temp_path, ignore_errors = True)
+    vectorizer.save(temp_path)
+
+    try:
+        os.replace(temp_path, path)
+    except OSError:
+        # another process saved the same vectorizer first
+        shutil.rmtree(temp_path, ignore_errors = True)
+
+def load_vectorizer(path):
+    if not os.path.isdir(path):
+        return None
+    return Vectorizer.open(path)
@@ -0,0 +1,134 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import *
+import scipy.sparse
+
+from classes.utils import *
+
+################ Clique Discovery ################
+#
+# - Finds every maximal clique (group of words that are all similar to each other) in a similarity graph,
+#   like the one made by Vectorizer.similarity_graph
+# - Bron–Kerbosch with pivoting: each step only branches on words the pivot isn't connected to
+# - Runs on its own stack instead of recursing, so big cliques can't hit the recursion limit
+# - Words are taken in degeneracy order (fewest connections first, removing them as it goes), and each word
+#   only looks for cliques among its neighbors that come after it, so every subproblem is small
+# - Those subproblems are independent, so they can be split across processes
+# - Cliques are yielded as they are found, and can be written straight to a file
+
+
+# one set of neighbors per word, from a (words x words) adjacency matrix; a word is never its own neighbor
+def get_neighbor_sets(graph):
+    graph = scipy.sparse.csr_matrix(graph)
+    indptr, indices = graph.indptr.tolist(), graph.indices.tolist()
+
+    return [set(indices[indptr[i] : indptr[i + 1]]) - {i} for i in range(graph.shape[0])]
+
+# repeatedly take out the word with the fewest neighbors left; returns the words in the order they were taken
+def get_degeneracy_order(neighbors):
+    degrees = [len(word_neighbors) for word_neighbors in neighbors]
+    buckets = [set() for _ in range(max(degrees, default = 0) + 1)]
+    for word, degree in enumerate(degrees):
+        buckets[degree].add(word)
+
+    order = []
+    removed = [False] * len(neighbors)
+    lowest = 0
+
+    for _ in range(len(neighbors)):
+        # taking a word out only lowers its neighbors' degrees by one, so the lowest bucket moves back at most one
+        lowest = max(lowest - 1, 0)
+        while not buckets[lowest]:
+            lowest += 1
+
+        word = buckets[lowest].pop()
+        removed[word] = True
+        order.append(word)
+
+        for neighbor in neighbors[word]:
+            if not removed[neighbor]:
+                buckets[degrees[neighbor]].remove(neighbor)
+                degrees[neighbor] -= 1
+                buckets[degrees[neighbor]].add(neighbor)
+
+    return order
+
+# every maximal clique that contains all of clique, and maybe some of candidates, but none of excluded
+def expand_clique(neighbors, clique, candidates, excluded, min_size = 2):
+    stack = [(clique, candidates, excluded)]
+
+    while stack:
+        clique, candidates, excluded = stack.pop()
+
+        if not candidates:
+            if not excluded and len(clique) >= min_size:
+                yield clique
+            continue
+
+        # not even every candidate would make it big enough
+        if len(clique) + len(candidates) < min_size:
+            continue
+
+        # any maximal clique has the pivot or a word the pivot isn't connected to,
+        # so only those words need their own branch
+        pivot = max(chain(candidates, excluded), key = lambda word: len(candidates & neighbors[word]))
+
+        for word in list(candidates - neighbors[pivot]):
+            stack.append((clique + [word], candidates & neighbors[word], excluded & neighbors[word]))
+            candidates = candidates - {word}
+            excluded = excluded | {word}
+
+# the cliques whose first word (in degeneracy order) is one of the given words
+def find_word_cliques(neighbors, ranks, words, min_size = 2):
+    for word in words:
+        later = {neighbor for neighbor in neighbors[word] if ranks[neighbor] > ranks[word]}
+        earlier = neighbors[word] - later
+        yield from expand_clique(neighbors, [word], later, earlier, min_size)
+
+
+# set once in each worker process, so the graph is only sent to a process once
+WORKER_GRAPH = None
+
+def set_worker_graph(neighbors, ranks):
+    global WORKER_GRAPH
+    WORKER_GRAPH = (neighbors, ranks)
+
+def find_word_cliques_in_worker(words, min_size):
+    neighbors, ranks = WORKER_GRAPH
+    return list(find_word_cliques(neighbors, ranks, words, min_size))
+
+
+# every maximal clique of min_size or more words in a similarity graph, as lists of word indices
+# with workers > 1 the words are split into chunks of chunk_size, and their cliques found in a process pool
+# (cliques still come out as each chunk is finished)
+def find_cliques(graph, min_size = 2, workers = None, chunk_size = 256):
+    neighbors = get_neighbor_sets(graph)
+    order = get_degeneracy_order(neighbors)
+
+    ranks = [0] * len(order)
+    for rank, word in enumerate(order):
+        ranks[word] = rank
+
+    if workers is None or workers <= 1:
+        yield from find_word_cliques(neighbors, ranks, order, min_size)
+        return
+
+    # the words late in the order have the fewest neighbors left to look at, so chunks take every n-th word
+    # to spread the work out evenly
+    chunk_count = max(-(-len(order) // chunk_size), 1)
+    chunks = [order[i::chunk_count] for i in range(chunk_count)]
+
+    with ProcessPoolExecutor(workers, initializer = set_worker_graph, initargs = (neighbors, ranks)) as executor:
+        for cliques in executor.map(find_word_cliques_in_worker, chunks, repeat(min_size)):
+            yield from cliques
+
+# write cliques to a file as they come in, one per line as a set of words, after an optional header
+# returns how many were written
+def save_cliques(filepath, cliques, vocab, header = ''):
+    count = 0
+    with open(filepath, 'w') as f:
+        f.write(header)
+        for clique in cliques:
+            f.write(('\n' if count else '') + str(set(vocab[word] for word in clique)))
+            count += 1
+
+    return count
\ No newline at end of file
@@ -1,24 +1,31 @@
-from collections import defaultdict, Counter
-from spellwise import CaverphoneOne
+from collections import defaultdict
 import tensorflow as tf
 from itertools import *
+import scipy.sparse
 import numpy as np
-import json
 
 from classes.utils import *
 from classes.crv import *
 from classes.vectorizer import *
+from classes.counting import *
+from classes.cache import *
+from classes.spellcorrector import *
+from classes.lemmatizer import *
+from classes.search import *
 
 
 ################ The Corpus Class ################
 #
-# - Stores a list of sentences and information about them
+# - Stores a list of sentences (as one flat array of word ids) and information about them
 # - Loads and cleans data
 # - Optionally lemmatizes (cleanliness -> clean ly ness) and corrects spelling errors
 # - Splits each sentence into a list of words
 # - Collects information
 # - Creates CRVs
 # - Creates a vectorizer
+# - Takes in new sentences without being rebuilt
+# - Finds words near each other (with a positional index)
+# - Optionally caches cleaned sentences and vectorizers on disk
 
 
 class Corpus:
@@ -27,22 +34,31 @@ class Corpus:
                  file_indexer  = None,   # some jsons have metadata, and so you need to index the actual text
                  text_mode     = 'word', # 'word' or 'char'
                  spell_correct = False,  # spell correct (fails on niche words)
-                 lemmatize     = True,   # remove 'er', 'ed', 's', 'ing', etc. to the best of its ability
+                 lemmatize     = True,   # remove 'er', 'ed', 's', 'ing', etc. to the best of its ability (or a Lemmatizer with your own rules)
                  removal_threshold = 0,  # replace a word with <= this many appearences in the corpus with <UNK>
+                 cache = None,           # folder to keep cleaned corpora and vectorizers in, so they load instantly next time
+                 workers = None,         # processes used for spell correction
                  log = True):
 
         # setup
         self.text_mode = text_mode
-        self.load_sentences(filepath, file_indexer)
-
-        # clean data
-        if spell_correct != False:
-            self.spell_correcter = CaverphoneOne()
-            self.spell_correcter.add_from_path(spell_correct)
-            self.spell_correct()
-
-        self.lemmatize() if lemmatize else None
-        self.remove_uncommon(removal_threshold) if removal_threshold >= 1 else None
+        self.replacements = []
+        self.lemmatizer = lemmatize if isinstance(lemmatize, Lemmatizer) else Lemmatizer()
+        filepath = get_json_path(filepath)
+
+        # the cache key covers the file's contents and every option that changes the cleaned sentences
+        self.cache = cache
+        self.cache_key = None
+        cache_key = None if cache is None else get_cache_key(
+            hash_file(filepath), file_indexer, text_mode,
+            spell_correct and [spell_correct, hash_file(spell_correct)], lemmatize and [self.lemmatizer.rules, self.lemmatizer.exclusions], removal_threshold)
+
+        if not self.load_cache(cache_key):
+            self.load_sentences(filepath, file_indexer)
+            self.clean(spell_correct, lemmatize != False, removal_threshold, workers)
+            self.save_cache(cache_key)
+
+        self.cache_key = cache_key
         
         # post_cleanup regathering
         self.scrape_data()
@@ -51,55 +67,135 @@ class Corpus:
         if not log:
             return
 
+        lengths = np.diff(self.offsets)
+
         print("Corpus loaded:")
         print("    - " + str(len(self.sentences)) + " sentences.")
         print("    - longest sentence: \n")
-        print(concat_sentence(max(self.sentences, key = len), self.text_mode))
+        print(concat_sentence(self.sentences[int(np.argmax(lengths))], self.text_mode))
         print(".    ")
         print("    - shortest sentence: \n")
-        print(concat_sentence(min(self.sentences, key = len), self.text_mode))
+        print(concat_sentence(self.sentences[int(np.argmin(lengths))], self.text_mode))
 
 
     # Data loading and standardization
 
     def load_sentences(self, filepath, file_indexer = None):
-        if filepath[-5:] != '.json':
-            filepath += '.json'
+        filepath = get_json_path(filepath)
 
-        with open(filepath) as f:
-            if file_indexer is None:
-                self.sentences = json.load(f)
-            else:
-                self.sentences = [item[file_indexer] for item in json.load(f)]
+        self.sentence_hashes = set()
+        self.set_tokens(*self.encode_records(iter_json_records(filepath, lines = True if filepath[-6:] == '.jsonl' else None), file_indexer))
+
+    # records are streamed one at a time: lowercased, and skipped if already seen,
+    # so the raw text is never held in memory all at once. sentences keep their file order
+    def stream_texts(self, records, file_indexer = None):
+        for record in records:
+            sentence = (record if file_indexer is None else record[file_indexer]).lower()
+
+            sentence_hash = hash_sentence(sentence)
+            if sentence_hash in self.sentence_hashes:
+                continue
+            self.sentence_hashes.add(sentence_hash)
+
+            yield sentence
+
+    def stream_sentences(self, records, file_indexer = None):
+        tokenizer = get_tokenizer(self.text_mode)
+        for sentence in self.stream_texts(records, file_indexer):
+            yield tokenizer.split(sentence)
+
+    # (tokens, offsets, token_vocab, token_indices) of new records
+    # in char mode the texts are encoded as arrays of code points, without splitting them into lists of chars
+    def encode_records(self, records, file_indexer = None):
+        if self.text_mode == 'char':
+            return encode_char_sentences(self.stream_texts(records, file_indexer))
+        return encode_sentences(self.stream_sentences(records, file_indexer))
+
+    # sentences are stored as a flat int32 array of word ids (self.tokens), with sentence i
+    # being self.tokens[self.offsets[i] : self.offsets[i + 1]], and self.token_vocab turning ids back into words.
+    # the list of lists of words is only built when it's looked at
+    @property
+    def sentences(self):
+        return SentenceList(self.tokens, self.offsets, self.token_vocab)
+
+    @sentences.setter
+    def sentences(self, sentences):
+        self.set_tokens(*encode_sentences(sentences))
+
+    def set_tokens(self, tokens, offsets, token_vocab, token_indices):
+        self.tokens, self.offsets, self.token_vocab, self.token_indices = tokens, offsets, token_vocab, token_indices
+        self.pending_replacements = []
+        self.word_counts = None
+        self.co_occurrence_counts = {}
+        self.distance_counts = []
+        self.reset_statistics()
+
+    # renumber the tokens so that word ids follow the given vocab; words not in it must not appear
+    def reindex(self, vocab):
+        new_ids = np.full(len(self.token_vocab), -1, dtype = np.int32)
+        new_ids[[self.token_indices[word] for word in vocab]] = np.arange(len(vocab), dtype = np.int32)
+
+        self.tokens        = new_ids[self.tokens]
+        self.token_vocab   = list(vocab)
+        self.token_indices = {word : i for i, word in enumerate(self.token_vocab)}
+        self.co_occurrence_counts = {}
+        self.distance_counts = []
+        self._positional_index = None
+
+    # caching
+
+    # the cache file for something made from this corpus with the given options
+    # there is none once the corpus was changed after loading (cache_key is None)
+    def get_cache_path(self, kind, *options):
+        if self.cache_key is None:
+            return None
+        return get_cache_path(self.cache, kind, get_cache_key(self.cache_key, *options))
+
+    # save the cleaned sentences, plus what's needed to add sentences later
+    def save_cache(self, cache_key):
+        if cache_key is None:
+            return
+
+        save_arrays(get_cache_path(self.cache, 'corpus', cache_key),
+                    {'tokens' : self.tokens, 'offsets' : self.offsets, 'sentence_hashes' : hashes_to_array(self.sentence_hashes)},
+                    {'token_vocab' : self.token_vocab, 'replacements' : self.replacements})
+
+    def load_cache(self, cache_key):
+        cached = None if cache_key is None else load_arrays(get_cache_path(self.cache, 'corpus', cache_key))
+        if cached is None:
+            return False
+
+        arrays, values = cached
+        token_vocab = values['token_vocab']
+        self.set_tokens(arrays['tokens'], arrays['offsets'], token_vocab, {word : i for i, word in enumerate(token_vocab)})
+        self.replacements    = values['replacements']
+        self.sentence_hashes = hashes_from_array(arrays['sentence_hashes'])
+        return True
 
-        # all lowercase, remove duplicates, split all
-        self.sentences = [sentence.lower() for sentence in self.sentences]
-        self.sentences = list(set(self.sentences))
-        self.sentences = [split_sentence(sentence, self.text_mode) for sentence in self.sentences]
 
     # data collection
 
+    # counts every word, only when the sentences were set from scratch: replacements keep the counts up to date
     def get_word_counts_and_vocab(self):
-        self.word_counts = sort_hl(dict(Counter(chain(*self.sentences))))
+        if self.word_counts is not None:
+            return
+
+        counts = np.bincount(self.tokens, minlength = len(self.token_vocab))
+        self.word_counts = sort_hl({self.token_vocab[i] : int(counts[i]) for i in np.flatnonzero(counts)})
         self.vocab = list(self.word_counts.keys())
         self.set_vocab = set(self.vocab)
-        
 
-    def scrape_data(self, log = True):
+        # from here on a word's id is also its index in the vocab
+        self.reindex(self.vocab)
 
-        self.get_word_counts_and_vocab()
 
-        self.sentence_indices = defaultdict(set)
+    def scrape_data(self, log = True):
 
-        for i, sentence in enumerate(self.sentences):
-            for word in set(sentence):
-                self.sentence_indices[word].add(i)
+        self.get_word_counts_and_vocab()
+        self.apply_replacements()
 
-        self.word_indices = {word : i for i, word in enumerate(self.vocab)}
-        self.total_word_count = sum(self.word_counts.values())
+        self.total_word_count = len(self.tokens)
         self.total_unique_word_count = len(self.vocab)
-        self.word_percentages = {item[0] : item[1] / self.total_word_count for item in self.word_counts.items()}
-        self.max_length = len(max(self.sentences, key = len))
 
         # log info
         if not log:
@@ -111,25 +207,82 @@ class Corpus:
         print("    - least common words: " + str(list(self.word_counts.keys())[-5:]))
         print('\n')
 
+    # statistics that aren't always needed are worked out the first time they're looked at,
+    # and forgotten whenever the sentences change
+    def reset_statistics(self):
+        self._sentence_indices = None
+        self._word_percentages = None
+        self._max_length = None
+        self._positional_index = None
+
+    # word -> ids of the sentences it's in
+    @property
+    def sentence_indices(self):
+        if self._sentence_indices is None:
+            self._sentence_indices = defaultdict(set, {self.vocab[word] : set(ids.tolist())
+                                                       for word, ids in self.group_sentence_ids(self.tokens, get_sentence_ids(self.offsets))})
+        return self._sentence_indices
+
+    @property
+    def word_percentages(self):
+        if self._word_percentages is None:
+            self._word_percentages = {item[0] : item[1] / self.total_word_count for item in self.word_counts.items()}
+        return self._word_percentages
+
+    @property
+    def max_length(self):
+        if self._max_length is None:
+            self._max_length = int(np.diff(self.offsets).max())
+        return self._max_length
+
+    @property
+    def word_indices(self):
+        return self.token_indices
+
+    # every (word id, sentence ids) pair, from every (word, sentence) pair in tokens
+    def group_sentence_ids(self, tokens, sentence_ids):
+        sentence_count = int(sentence_ids.max()) + 1 if len(sentence_ids) else 1
+        pairs = np.unique(tokens.astype(np.int64) * sentence_count + sentence_ids)
+        words, sentence_ids = np.divmod(pairs, sentence_count)
+        words, starts = np.unique(words, return_index = True)
+
+        return zip(words.tolist(), np.split(sentence_ids, starts[1:]))
+
 
     # Data cleanup
 
-    def spell_correct(self):
+    # every step only looks at the vocab and word counts, so the steps are worked out one after another
+    # and their replacements are all made to the sentences at once, at the end
+    def clean(self, spell_correct = False, lemmatize = True, removal_threshold = 0, workers = None):
         self.get_word_counts_and_vocab()
-        self.replace(self.get_correctable_words())
 
-    def lemmatize(self):
-        self.get_word_counts_and_vocab()
-        self.replace(self.get_lemmatizable_words())
+        if spell_correct != False:
+            self.spell_correcter = SpellCorrector(spell_correct, self.cache, workers)
+            self.spell_correct(apply = False)
 
-    def remove_uncommon(self, n = 0):
-        self.get_word_counts_and_vocab()
-        self.replace({word : ['<UNK>'] for word in self.set_vocab if self.word_counts[word] <= n})        
+        self.lemmatize(apply = False) if lemmatize else None
+        self.remove_uncommon(removal_threshold, apply = False) if removal_threshold >= 1 else None
+
+        self.apply_replacements()
+
+    # apply = False only updates the vocab and word counts, see apply_replacements
+    def spell_correct(self, apply = True):
+        self.replace(self.get_correctable_words(), apply)
+
+    def lemmatize(self, apply = True):
+        self.replace(self.get_lemmatizable_words(), apply)
+
+    def remove_uncommon(self, n = 0, apply = True):
+        self.replace({word : ['<UNK>'] for word in self.set_vocab if self.word_counts[word] <= n}, apply)
 
     def get_correctable_words(self, word_set = None):
         possible_corrections = defaultdict(str)
+        word_set = word_set or (self.set_vocab - set(['<START>', '<END>', '<UNK>']))
+
+        # look up every word at once, so only words never seen before are encoded (in parallel)
+        self.spell_correcter.encode([word for word in word_set if len(word) > 3])
 
-        for word in word_set or (self.set_vocab - set(['<START>', '<END>', '<UNK>'])):
+        for word in word_set:
             result = self.get_correction(word)
             if result != word:
                 possible_corrections[word] = result
@@ -140,9 +293,7 @@ class Corpus:
         if len(word) <= 3:
             return word
 
-        corrections = self.spell_correcter.get_suggestions(word)
-        corrections = {item['word'] : item['distance'] for item in corrections}
-        same_keys = set(corrections.keys()).intersection(self.set_vocab)
+        same_keys = set(self.spell_correcter.get_suggestions(word)).intersection(self.set_vocab)
 
         if len(same_keys) == 0:
             return word
@@ -159,173 +310,139 @@ class Corpus:
 
 
 
+    # the rules live in self.lemmatizer (see classes/Lemmatizer.py), and stems are looked up in the vocab's set
     def get_lemmatizable_words(self, word_set = None):
-        lemmatizable_words = defaultdict(str)
+        return defaultdict(str, self.lemmatizer.lemmatize_words(word_set or self.vocab, self.set_vocab))
 
-        for word in word_set or self.vocab:
-            if len(word) <= 4:
-                continue
 
-            # word ends in 's'
-            if (word[-1] == 's') and (word[-2:] != 'ss') and (word[-3:] != 'ous'):
-                # some words with a y change spelling (candy -> candies)
-                if word[-3:] == 'ies' and word[:-3] + 'y' in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_ies->_y+s')
-                # words that normally end in 's' have 'es' added
-                elif word[-3:] == 'ses' and word[:-2] in self.vocab:      
-                    lemmatizable_words[word] = lemmatize(word, '_es->_+s')
-                # words uses usual 's' rules
-                elif word[:-1] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_s->_+s')
-
-            # word ends in 'ly'
-            elif word[-2:] == 'ly':
-                if word[:-1] + 'e' in self.set_vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_y->_e+ly')# fully
-                elif word[:-2] in self.set_vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_ly->_+ly')# fully
-
-            # word ends in 'ness'
-            elif word[-4:] == 'ness':
-                lemmatizable_words[word] = lemmatize(word, '_ness->_+ness')
-
-            elif word[-4:] == 'less' and word != 'less':
-                lemmatizable_words[word] = lemmatize(word, '_less->_+less')
-
-            # word ends in 'ing'
-            elif word [-3:] == 'ing':
-                # putting -> put ing
-                if word[-5] == word[-4] and word[:-4] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_?ing->_+ing')
-                # baking -> bake ing
-                elif word[:-3] + 'e' in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_ing->_e+ing')
-                # working -> work ing
-                elif word[:-3] in self.vocab and len(word) > 5:
-                    lemmatizable_words[word] = lemmatize(word, '_ing->_+ing')
-
-            # word ends in 'er'
-            elif (word != 'er') and (word[-2:] == 'er'):
-                # happier -> happy er
-                if word[-3:] == 'ier' and word[:-3] + 'y' in self.vocab:
-                    lemmatizable_words[word] =  lemmatize(word, '_ier->_y+er')
-                # canner -> can er
-                elif word[-4] == word[-3] and word[:-3] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_?er->_+er')
-                # baker -> bake er
-                elif word[:-1] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_r->_+er')
-                # mixer -> mix er
-                elif word[:-2] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_er->_+er')
-
-            # ord ends in 'ed'
-            elif (word != 'ed') and word[-2:] == 'ed':
-                # carried -> carry ed
-                if word[-3:] == 'ied' and word[:-3] + 'y' in self.vocab:
-                    lemmatizable_words[word] =  lemmatize(word, '_ied->_y+ed')
-                # canned -> can ed
-                elif word[-4] == word[-3] and word[:-3] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_?ed->_+ed')
-                # baked -> bake ed
-                elif word[:-1] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_d->_+ed')
-                # mixed -> mix ed
-                elif word[:-2] in self.vocab:
-                    lemmatizable_words[word] = lemmatize(word, '_ed->_+ed')
-        
-        return lemmatizable_words
+    # chained replacements are followed once up front, and the word counts are updated from what's replaced
+    # the sentences are rewritten by apply_replacements, in one pass for any number of replace calls
+    def replace(self, replacements, apply = True):
+        # kept, so sentences added later get the same cleanup
+        self.replacements.append(replacements)
+        self.pending_replacements.append(replacements)
+        self.cache_key = None
 
+        resolved = resolve_replacements(replacements)
+        removed_counts = {word : self.word_counts.pop(word) for word in resolved if word in self.word_counts}
+        for word, count in removed_counts.items():
+            for new_word in resolved[word]:
+                self.word_counts[new_word] = self.word_counts.get(new_word, 0) + count
 
-    def replace(self, replacements):
-        replacement_set = set(replacements.keys())
+        self.word_counts = sort_hl(self.word_counts)
+        self.vocab = list(self.word_counts.keys())
+        self.set_vocab = set(self.vocab)
 
-        self.sentences = [self.replace_sentence(sentence, replacements, replacement_set)
-                          for sentence in self.sentences]
+        if apply:
+            self.apply_replacements()
 
-    def replace_sentence(self, sentence, replacements, replacement_set):
-        for i in range(5):
-            output_sentence = []
-            edited = False
-            for word in sentence:
-                if word not in replacement_set:
-                    output_sentence.append(word)
-                    continue
+    def apply_replacements(self):
+        if not self.pending_replacements:
+            return
 
-                edited = True
-                output_sentence.extend(replacements[word])
+        replacements = compose_replacements(self.pending_replacements)
+        self.pending_replacements = []
 
-            if not edited:
-                break
+        self.tokens, self.offsets, self.token_vocab, self.token_indices = replace_tokens(self.tokens, self.offsets, self.token_vocab, replacements)
+        self.co_occurrence_counts = {}
+        self.distance_counts = []
+        self.reset_statistics()
 
-            sentence = output_sentence
-        return output_sentence
+        # the same order a recount gives
+        self.word_counts = sort_hl({word : self.word_counts[word] for word in self.token_vocab})
+        self.vocab = list(self.word_counts.keys())
+        self.reindex(self.vocab)
 
                  
     # CRVs
 
-    def create_vectorizer(self, window_size = 2, removal_threshold = 0, log = True):
-        signatures = self.create_signatures(window_size, log = False)
-
-        if removal_threshold > 0:
-            for sig_word in [word for word in self.set_vocab if self.word_counts[word] <= removal_threshold]:
-                for word in self.vocab:
-                    popped = signatures[word].pop(sig_word)
-                    if popped is not None:
-                        signatures[word]['<UNK>'] += popped
-
-        encoding_vocab = list(sort_hl({word:self.word_counts[word] for word in self.set_vocab if self.word_counts[word] > removal_threshold}).keys())
-        encoding_indices = {word:i for i, word in enumerate(encoding_vocab)}
-
-        try:
-            matrix = np.zeros((len(self.vocab), len(encoding_vocab)))# how to do
-        except:# could break because vocab doesnt exist yet, and will give wrong message
-            raise Exception("Vocab is too big. Consider using create_signatures instead")
+    # tallies of every word pair within window_size words of each other, as a sparse (vocab x vocab) matrix
+    # window_size can also weight each distance, e.g. (1, 0.5, 0.25), or each side, e.g. ((1, 1), ()) (see get_distance_weights)
+    # or be 'document', pairing every word with every other word of its sentence
+    # workers > 1 counts shards of the corpus in that many processes
+    # tallies are kept, so they can be updated when sentences are added
+    # if the tallies of each distance were kept (get_distance_counts), they're made from those without counting again
+    def get_co_occurrence_counts(self, window_size = 2, workers = None):
+        window_size = to_window_size(window_size)
+        if window_size not in self.co_occurrence_counts:
+            if 0 < get_window_distance(window_size) <= len(self.distance_counts):
+                counts = combine_distance_counts(self.distance_counts, *get_distance_weights(window_size))
+            else:
+                counts = count_co_occurrences(self.tokens, self.offsets, len(self.vocab), window_size, workers)
+            self.co_occurrence_counts[window_size] = counts
+        return self.co_occurrence_counts[window_size]
+
+    # tallies of the pairs at each distance up to max_distance, to the right (see count_distance_co_occurrences)
+    # counted in one pass and kept, so every window up to max_distance comes from them
+    def get_distance_counts(self, max_distance, workers = None):
+        if len(self.distance_counts) < max_distance:
+            self.distance_counts = count_distance_co_occurrences(self.tokens, self.offsets, len(self.vocab), max_distance, workers)
+        return self.distance_counts[:max_distance]
+
+    # a vectorizer for each window size (or weighting), with the corpus only counted once, for the largest
+    def create_vectorizers(self, window_sizes = (1, 2, 3, 4), removal_threshold = 0, log = True, workers = None, sparse = False):
+        window_sizes = [to_window_size(window_size) for window_size in window_sizes]
+        self.get_distance_counts(max(get_window_distance(window_size) for window_size in window_sizes), workers)
+
+        return {window_size : self.create_vectorizer(window_size, removal_threshold, log, workers, sparse) for window_size in window_sizes}
+
+    # a vectorizer of every word's 'theme': what it's near in the whole sentence (or document) it's in
+    def create_theme_vectorizer(self, removal_threshold = 0, log = True, sparse = True):
+        return self.create_vectorizer(DOCUMENT_WINDOW, removal_threshold, log, sparse = sparse)
+
+    # sparse = True keeps the matrix as a scipy csr matrix, which only stores the non-zero values
+    def create_vectorizer(self, window_size = 2, removal_threshold = 0, log = True, workers = None, sparse = False):
+        cache_path = self.get_cache_path('vectorizer', window_size, removal_threshold, sparse)
+        vectorizer = None if cache_path is None else load_vectorizer(cache_path)
+
+        if vectorizer is None:
+            vectorizer = self.build_vectorizer(window_size, removal_threshold, workers, sparse)
+            if cache_path is not None:
+                save_vectorizer(vectorizer, cache_path)
 
-        for word in self.vocab:
-            for sig_word in signatures[word]:
-                matrix[self.word_indices[word], encoding_indices[sig_word]] = signatures[word][sig_word]
-        
         if log:
             print("Vectorizer created:")
-            print(f"    - {len(self.vocab)} unique words;")
-            print(f"    - {len(encoding_vocab)} CRV words")
+            print(f"    - {vectorizer.vsize} unique words;")
+            print(f"    - {vectorizer.csize} CRV words")
 
-        return Vectorizer(self.vocab, matrix, encoding_vocab)
-        
-        
-    # a Vectorizer requires a matrix. If it's too large, this makes CRVs instead
-    def create_signatures(self, window_size = 2, log = True):
+        return vectorizer
 
-        # setup signatures
-        
-        signatures = { word : defaultdict(int) for word in self.vocab }
-        
-        # collect word counts for each word
+    def build_vectorizer(self, window_size = 2, removal_threshold = 0, workers = None, sparse = False):
+        counts = self.get_co_occurrence_counts(window_size, workers)
+
+        encoding_vocab = [word for word in self.vocab if self.word_counts[word] > removal_threshold]
 
-        for sentence in self.sentences:
-            
-            for window_center in range(len(sentence)):
+        # words with <= removal_threshold appearances are not encoded, their tallies go to <UNK>
+        if len(encoding_vocab) < len(self.vocab):
+            if '<UNK>' not in encoding_vocab:
+                encoding_vocab.append('<UNK>')
 
-                # the word that we will collect signatures for
-                # around it
-                center_word = sentence[window_center]
+            encoding_indices = {word:i for i, word in enumerate(encoding_vocab)}
+            column_map = [encoding_indices.get(word, encoding_indices['<UNK>']) for word in self.vocab]
+            counts = merge_columns(counts, column_map, len(encoding_vocab))
 
-                for word_index in range(max(0, window_center - window_size), min(window_center + window_size + 1, len(sentence))):
+        matrix = normalize_rows(counts)
 
-                    # while sliding the window, don't include the given word, which will always be in the center of the window
-                    if word_index == window_center:
-                        continue
+        if not sparse:
+            try:
+                matrix = matrix.toarray()
+            except MemoryError:
+                raise Exception("Vocab is too big. Consider using sparse = True or create_signatures instead")
 
-                    # add one to the count for that word's occurence next to the given word
-                    nearby_word = sentence[word_index]
-                    signatures[center_word][nearby_word] += 1
+        return Vectorizer(self.vocab, matrix, encoding_vocab, counts = counts, window_size = window_size)
+        
+        
+    # a Vectorizer requires a matrix. If it's too large, this makes CRVs instead
+    def create_signatures(self, window_size = 2, log = True, workers = None):
 
+        # tally and normalize, then read each row out as a CRV
+        matrix = normalize_rows(self.get_co_occurrence_counts(window_size, workers))
+        ids = get_crv_ids(self.vocab)[matrix.indices]
 
-        # divide signatures by counts
-        for word in self.vocab:
-            total_co_occurences = sum(signatures[word].values())
-            signatures[word] = CRV({key: val / total_co_occurences for key, val in signatures[word].items()})
+        signatures = {}
+        for i, word in enumerate(self.vocab):
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            signatures[word] = CRV.from_arrays(ids[start : end], matrix.data[start : end])
 
         # log data
         if not log:
@@ -341,60 +458,133 @@ class Corpus:
         return signatures
 
 
-    # Corpus Search
-
-    def get_ragged_int_tensor(self):
-        return tf.ragged.constant([[self.word_indices[word] for word in sentence] for sentence in self.sentences], dtype = tf.int16)
-
-    
-    def find(self, words, max_seperation = 3, max_prints = 10, print_size = 20):
-        # once you find a set, skip past the first findable word, or you get duplicates
-        prints_so_far = 0
-        total_found = 0
+    # Incremental updates
+
+    # add new raw sentences (e.g. another day of chat logs) without rebuilding the corpus
+    # - the cleanup replacements made while loading are replayed on them
+    #   (words never seen before are kept as they are, not spell corrected or lemmatized)
+    # - new words are added to the end of the vocab instead of re-sorting it
+    # - kept co-occurrence tallies, and any given vectorizers made from this corpus, get the new tallies added
+    def add_sentences(self, sentences, vectorizers = (), log = True):
+        if isinstance(vectorizers, Vectorizer):
+            vectorizers = [vectorizers]
+
+        for vectorizer in vectorizers:
+            if vectorizer.counts is None or vectorizer.vsize != len(self.vocab):
+                raise Exception("Vectorizer can't be updated, it was not created from this corpus as it is now")
+
+        # the corpus no longer matches its source file
+        self.cache_key = None
+
+        # the new sentences are encoded and cleaned on their own, then given the corpus' ids
+        # new words get the next free ids, which keeps ids equal to vocab indices
+        tokens, offsets, token_vocab, _ = self.encode_records(sentences)
+        tokens, offsets, token_vocab, _ = replace_tokens(tokens, offsets, token_vocab, compose_replacements(self.replacements))
+
+        old_vocab_size = len(self.vocab)
+        first_sentence = len(self.offsets) - 1
+        tokens = np.array([self.token_indices.setdefault(word, len(self.token_indices)) for word in token_vocab], dtype = np.int32)[tokens]
+        token_vocab = list(self.token_indices)
+
+        new_words = token_vocab[old_vocab_size:]
+        self.token_vocab = token_vocab
+        self.tokens  = np.concatenate([self.tokens, tokens])
+        self.offsets = np.concatenate([self.offsets, offsets[1:] + self.offsets[-1]])
+
+        # word counts and statistics
+        counts = np.bincount(tokens, minlength = len(token_vocab))
+        for i in np.flatnonzero(counts).tolist():
+            self.word_counts[token_vocab[i]] = self.word_counts.get(token_vocab[i], 0) + int(counts[i])
+
+        self.vocab = self.vocab + new_words
+        self.set_vocab.update(new_words)
+
+        if self._sentence_indices is not None:
+            for word, ids in self.group_sentence_ids(tokens, get_sentence_ids(offsets)):
+                self._sentence_indices[self.vocab[word]].update((ids + first_sentence).tolist())
+        if self._max_length is not None:
+            self._max_length = max(self._max_length, int(np.diff(offsets).max(initial = 0)))
+        self._word_percentages = None
+        self._positional_index = None
+
+        self.total_word_count += len(tokens)
+        self.total_unique_word_count = len(self.vocab)
 
-        if type(words) == str:
-            words = [words]
+        # tallies: the windows never cross sentences, so the new sentences' tallies are exactly what changed
+        # the new sentences are counted once per distance, and every window is made from those
+        window_sizes = set(self.co_occurrence_counts) | set(to_window_size(vectorizer.window_size) for vectorizer in vectorizers)
+        max_distance = max([len(self.distance_counts)] + [get_window_distance(window_size) for window_size in window_sizes])
+        new_distance_counts = count_distance_co_occurrences(tokens, offsets, len(self.vocab), max_distance)
+
+        new_counts = {}
+        for window_size in window_sizes:
+            if window_size == DOCUMENT_WINDOW:
+                new_counts[window_size] = count_document_co_occurrences(tokens, offsets, len(self.vocab))
+            elif get_window_distance(window_size) == 0:
+                new_counts[window_size] = scipy.sparse.csr_matrix((len(self.vocab), len(self.vocab)), dtype = np.int64)
+            else:
+                new_counts[window_size] = combine_distance_counts(new_distance_counts, *get_distance_weights(window_size))
 
-        common_sentences = set(self.sentence_indices[words[0]]).union(*[self.sentence_indices[word] for word in words])
-        valid_sentences = set()
+        self.distance_counts = [resize_counts(counts, new_distance_counts[i].shape) + new_distance_counts[i] for i, counts in enumerate(self.distance_counts)]
 
-        if len(common_sentences) == 0:
-            print('None Found')
-            return common_sentences
-        
-        for sentence_index in common_sentences:
-            sentence = self.sentences[sentence_index]
+        for window_size, counts in self.co_occurrence_counts.items():
+            self.co_occurrence_counts[window_size] = resize_counts(counts, new_counts[window_size].shape) + new_counts[window_size]
 
-            last_index = -100
+        for vectorizer in vectorizers:
+            self.update_vectorizer(vectorizer, new_counts[to_window_size(vectorizer.window_size)], old_vocab_size)
 
-            for i in range(len(sentence)):
+        if log:
+            print("Sentences added:")
+            print(f"    - {len(offsets) - 1} new sentences, {len(self.offsets) - 1} in total;")
+            print(f"    - {len(new_words)} new words, {len(self.vocab)} in total")
+
+    # give a vectorizer the tallies of new sentences; new words become new rows and columns
+    # words that were not encoded (seen too few times) still go to <UNK>
+    def update_vectorizer(self, vectorizer, counts, old_vocab_size):
+        new_words = self.vocab[old_vocab_size:]
+        new_embedding_words = [word for word in new_words if word not in vectorizer.embedding_indices]
+        new_embedding_indices = {word : vectorizer.csize + i for i, word in enumerate(new_embedding_words)}
+        embedding_size = vectorizer.csize + len(new_embedding_words)
+
+        # only the columns that were actually used need to be looked up
+        column_map = np.zeros(len(self.vocab), dtype = np.int64)
+        for i in np.unique(counts.indices).tolist():
+            word = self.vocab[i]
+            if word in vectorizer.embedding_indices:
+                column_map[i] = vectorizer.embedding_indices[word]
+            elif i < old_vocab_size:
+                column_map[i] = vectorizer.embedding_indices['<UNK>']
+            else:
+                column_map[i] = new_embedding_indices[word]
 
-                sentence_slice = sentence[i:min(len(sentence), i + max_seperation)]
+        counts = scipy.sparse.csr_matrix((counts.data, column_map[counts.indices], counts.indptr), shape = (len(self.vocab), embedding_size))
+        counts.sum_duplicates()
 
-                slice_valid = True
-                for search_word in words:
-                    if search_word not in sentence_slice:
-                       slice_valid = False
-                       break
-                    sentence_slice.remove(search_word)
+        vectorizer.add_counts(counts, new_words, new_embedding_words)
 
-                if (i - last_index) < max_seperation:
-                    slice_valid = False
 
-                if not slice_valid:
-                    continue
+    # Corpus Search
 
-                if prints_so_far < max_prints:
-                    print_center = i + len(sentence_slice) // 2
-                    print(concat_sentence(sentence[max(0, print_center - print_size // 2) : min(len(sentence), print_center + print_size // 2)], self.text_mode))
-                    print('\n \n')
-                    prints_so_far += 1
-                    last_index = i
+    def get_ragged_int_tensor(self):
+        return tf.RaggedTensor.from_row_splits(self.tokens.astype(np.int16), self.offsets)
 
-                valid_sentences.add(sentence_index)
-                total_found += 1
+    
+    # where every word appears, built the first time it's needed
+    @property
+    def positional_index(self):
+        if self._positional_index is None:
+            self._positional_index = PositionalIndex(self.tokens, self.offsets, len(self.token_vocab))
+        return self._positional_index
+
+    # every place the words are all within max_seperation words of each other, as a Concordance
+    # (shows the first max_prints snippets of print_size words, use .page(n) for more and .sentence_ids for the sentences)
+    def find(self, words, max_seperation = 3, max_prints = 10, print_size = 20):
+        if type(words) == str:
+            words = [words]
 
-        print(f"Total Found : {total_found}")
-        print(f"Found in {len(valid_sentences)} sentences")
+        if all(word in self.token_indices for word in words):
+            starts, ends = self.positional_index.find([self.token_indices[word] for word in words], max_seperation)
+        else:
+            starts, ends = np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
 
-        return valid_sentences
\ No newline at end of file
+        return Concordance(starts, ends, self.tokens, self.offsets, self.token_vocab, self.text_mode, print_size, max_prints)
\ No newline at end of file
@@ -0,0 +1,187 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import *
+import scipy.sparse
+import numpy as np
+
+from classes.utils import *
+
+################ Co-occurrence Counting ################
+#
+# - Counts how often words appear near each other, straight from flat arrays of word ids
+# - Pairs are found by shifting the token array against itself, instead of looping over every window
+# - Tallies are kept as sparse (vocab x vocab) matrices: rows are center words, columns are nearby words
+# - Can split the sentences into shards and count them in separate processes
+# - Small vocabularies (like the chars of a text_mode = 'char' corpus) are tallied into a dense matrix with one
+#   bincount per distance, without building any sparse matrices along the way
+# - Whole-sentence ('document') windows are tallied as a product of a sparse (sentences x words) count matrix,
+#   so they cost about the number of non-zero products instead of every sentence's length squared
+# - Can keep the tallies of each distance apart (to the right only, the left side is their transpose),
+#   so every window size up to the largest, and any weighting of the distances, come from one count
+# - Turns tallies into CRV values (each row divided by its sum)
+
+
+# count every (center, nearby word) pair within window_size words of each other, never crossing sentences
+# tokens are word ids, sentence i is tokens[offsets[i] : offsets[i + 1]]
+# window_size can also be a weighting of the distances (see get_distance_weights), or 'document' for whole sentences
+# with workers > 1 the sentences are split into shards, counted in a process pool, and the tallies added up;
+# tallies are integers, so the result is exactly the same as counting in one process
+def count_co_occurrences(tokens, offsets, vocab_size, window_size = 2, workers = None):
+    if window_size == DOCUMENT_WINDOW:
+        return count_document_co_occurrences(tokens, offsets, vocab_size)
+
+    right_weights, left_weights = get_distance_weights(window_size)
+    max_distance = get_window_distance(window_size)
+    if max_distance == 0:
+        return scipy.sparse.csr_matrix((vocab_size, vocab_size), dtype = np.int64)
+
+    distance_counts = count_distance_co_occurrences(tokens, offsets, vocab_size, max_distance, workers)
+    return combine_distance_counts(distance_counts, right_weights, left_weights)
+
+# tallies of the pairs at each distance from 1 to max_distance, to the right only: distance_counts[d - 1][a, b]
+# is how often b is d words after a. b being d words before a is the transpose, so any window up to
+# max_distance, or any weighting of the distances, can be made from these without counting again
+def count_distance_co_occurrences(tokens, offsets, vocab_size, max_distance = 2, workers = None):
+    if workers is not None and workers > 1:
+        shards = split_shards(tokens, offsets, workers)
+        with ProcessPoolExecutor(workers) as executor:
+            partial_counts = list(executor.map(count_distance_co_occurrences,
+                                               *zip(*shards), repeat(vocab_size), repeat(max_distance)))
+            return [sum(counts[1:], counts[0]) for counts in zip(*partial_counts)]
+
+    if vocab_size * vocab_size <= DENSE_COUNT_LIMIT:
+        return [scipy.sparse.csr_matrix(counts) for counts in count_dense_distance_co_occurrences(tokens, offsets, vocab_size, max_distance)]
+
+    sentence_ids = get_sentence_ids(offsets)
+    distance_counts = []
+
+    for distance in range(1, max_distance + 1):
+        same_sentence = sentence_ids[distance:] == sentence_ids[:-distance]
+        distance_counts.append(count_pairs(tokens[:-distance][same_sentence], tokens[distance:][same_sentence], vocab_size))
+
+    return distance_counts
+
+# window_size -> (weights of the distances to the right, weights of the distances to the left), closest first
+# - an int n counts every word up to n words away on either side once: (1, 1 ... 1) both ways
+# - a tuple of numbers weights the distances the same on both sides: (1, 0.5, 0.25)
+# - a pair of tuples weights each side on its own: ((1, 1), ()) only counts the two words after
+def get_distance_weights(window_size):
+    if isinstance(window_size, (int, np.integer)):
+        return (1,) * int(window_size), (1,) * int(window_size)
+
+    window_size = to_window_size(window_size)
+    if len(window_size) == 2 and all(isinstance(weights, tuple) for weights in window_size):
+        return window_size
+    return window_size, window_size
+
+# how far away the furthest counted word of a window is (a document window isn't counted by distance)
+def get_window_distance(window_size):
+    if window_size == DOCUMENT_WINDOW:
+        return 0
+    return max(len(weights) for weights in get_distance_weights(window_size))
+
+# a window size in a hashable form (lists, as they come back from json, become tuples)
+def to_window_size(window_size):
+    if isinstance(window_size, (list, tuple)):
+        return tuple(to_window_size(part) for part in window_size)
+    return window_size
+
+# add up per distance tallies with a weight for each distance and side; integer weights keep integer tallies
+def combine_distance_counts(distance_counts, right_weights, left_weights = None):
+    left_weights = right_weights if left_weights is None else left_weights
+    if max(len(right_weights), len(left_weights)) > len(distance_counts):
+        raise Exception(f'Only {len(distance_counts)} distances were counted, not {max(len(right_weights), len(left_weights))}')
+
+    def weighted_sum(weights):
+        total = scipy.sparse.csr_matrix(distance_counts[0].shape, dtype = np.int64)
+        for weight, counts in zip(weights, distance_counts):
+            if weight:
+                total = total + (counts if weight == 1 else counts * weight)
+        return total
+
+    right = weighted_sum(right_weights)
+    left = right if tuple(left_weights) == tuple(right_weights) else weighted_sum(left_weights)
+    return (right + left.T).tocsr()
+
+# the window that covers every other word of the sentence
+DOCUMENT_WINDOW = 'document'
+
+# the same tallies as a window as long as the longest sentence, from a (sentences x words) count matrix D:
+# two different positions in a sentence with words a and b make a pair, so sentence s adds n_s(a) * n_s(b) to (a, b),
+# which is (D^T D)[a, b], except that a word is never paired with itself, so a word only pairs with the
+# n_s(a) - 1 other copies of itself: the diagonal is n_s(a)^2 - n_s(a), (D^T D) less the word's total count
+def count_document_co_occurrences(tokens, offsets, vocab_size):
+    documents = scipy.sparse.csr_matrix(
+        (np.ones(len(tokens), dtype = np.int64), (get_sentence_ids(offsets), tokens)),
+        shape = (len(offsets) - 1, vocab_size))
+    documents.sum_duplicates()
+
+    words = np.arange(vocab_size)
+    totals = scipy.sparse.csr_matrix((np.bincount(tokens, minlength = vocab_size).astype(np.int64), (words, words)), shape = (vocab_size, vocab_size))
+    counts = (documents.T @ documents - totals).tocsr()
+    counts.eliminate_zeros()
+    return counts
+
+# vocabularies up to about 2000 words are tallied densely (a vocab_size x vocab_size array of int64)
+DENSE_COUNT_LIMIT = 1 << 22
+
+# the same right side tallies per distance, as dense arrays: each pair is numbered center * vocab_size + nearby word,
+# so a bincount of those numbers is the flattened tally matrix
+def count_dense_distance_co_occurrences(tokens, offsets, vocab_size, max_distance = 2):
+    sentence_ends = np.asarray(offsets[1:-1])
+    tokens = np.asarray(tokens, dtype = np.int64)
+    distance_counts = []
+
+    for distance in range(1, max_distance + 1):
+        if distance >= len(tokens):
+            distance_counts.append(np.zeros((vocab_size, vocab_size), dtype = np.int64))
+            continue
+
+        # a pair crosses sentences if it starts less than distance tokens before a sentence's end
+        same_sentence = np.ones(len(tokens) - distance, dtype = bool)
+        for shift in range(1, distance + 1):
+            starts = sentence_ends - shift
+            same_sentence[starts[(starts >= 0) & (starts < len(same_sentence))]] = False
+
+        pairs = tokens[:-distance] * vocab_size + tokens[distance:]
+        distance_counts.append(np.bincount(pairs[same_sentence], minlength = vocab_size * vocab_size).reshape(vocab_size, vocab_size))
+
+    return distance_counts
+
+# split sentences into about equally sized (tokens, offsets) shards, never splitting a sentence
+def split_shards(tokens, offsets, shard_count):
+    bounds = np.searchsorted(offsets, np.linspace(0, offsets[-1], shard_count + 1))
+    bounds = np.unique(np.concatenate([[0], bounds, [len(offsets) - 1]]))
+
+    return [(tokens[offsets[start] : offsets[end]], offsets[start : end + 1] - offsets[start])
+            for start, end in zip(bounds[:-1], bounds[1:])]
+
+# tally (center, nearby word) id pairs into a sparse matrix; duplicate pairs are summed
+def count_pairs(centers, neighbors, vocab_size):
+    return scipy.sparse.coo_matrix(
+        (np.ones(len(centers), dtype = np.int64), (centers, neighbors)),
+        shape = (vocab_size, vocab_size)).tocsr()
+
+# divide each row by its sum, so every row is a CRV; empty rows stay empty
+def normalize_rows(counts):
+    counts = scipy.sparse.csr_matrix(counts)
+    totals = np.asarray(counts.sum(axis = 1)).ravel()
+    values = counts.data / np.repeat(totals, np.diff(counts.indptr))
+
+    return scipy.sparse.csr_matrix((values, counts.indices, counts.indptr), shape = counts.shape)
+
+# grow a tally matrix to a bigger shape, the new rows and columns are empty
+def resize_counts(counts, shape):
+    indptr = np.concatenate([counts.indptr, np.full(shape[0] - counts.shape[0], counts.indptr[-1])])
+    return scipy.sparse.csr_matrix((counts.data, counts.indices, indptr), shape = shape)
+
+# add the columns of words that are not encoded into another column (e.g. rare words into <UNK>)
+# column_map[i] is the new column of old column i
+def merge_columns(counts, column_map, column_count):
+    merge = scipy.sparse.csr_matrix(
+        (np.ones(len(column_map), dtype = counts.dtype), (np.arange(len(column_map)), column_map)),
+        shape = (len(column_map), column_count))
+
+    # (the product's columns come out unsorted, which scipy would otherwise sort in place later)
+    merged = (counts @ merge).tocsr()
+    merged.sort_indices()
+    return merged
@@ -0,0 +1,142 @@
+################ The Lemmatizer Class ################
+#
+# - Holds the suffix rules used to lemmatize words as data ('_ies->_y+s', '_?ing->_+ing', ...)
+#   ('?' is a doubled letter, hitting -> hit ing)
+# - Rules are grouped by the word ending they handle, and a word only tries the rules of the first ending it has
+#   (so adding rules to one ending never slows down words with another)
+# - Endings are kept in an index by length, so finding a word's ending is a few dict lookups
+# - Stems are checked against a hashed vocabulary, so a whole vocabulary is lemmatized in one linear pass
+
+
+# (ending, rule, whether the stem has to be in the vocab, shortest word the rule is used on)
+# endings are tried in this order, and a word's rules in the order they're listed
+LEMMA_RULES = [
+    ('s',    '_ies->_y+s',     True,  5),   # candies -> candy s
+    ('s',    '_ses->_s+s',     True,  5),   # buses -> bus s
+    ('s',    '_s->_+s',        True,  5),   # cats -> cat s
+    ('ly',   '_y->_e+ly',      True,  5),   # gently -> gentle ly
+    ('ly',   '_ly->_+ly',      True,  5),   # fully -> full ly
+    ('ness', '_ness->_+ness',  False, 5),   # cleanness -> clean ness
+    ('less', '_less->_+less',  False, 5),   # careless -> care less
+    ('ing',  '_?ing->_+ing',   True,  5),   # putting -> put ing
+    ('ing',  '_ing->_e+ing',   True,  5),   # baking -> bake ing
+    ('ing',  '_ing->_+ing',    True,  6),   # working -> work ing
+    ('er',   '_ier->_y+er',    True,  5),   # happier -> happy er
+    ('er',   '_?er->_+er',     True,  5),   # canner -> can er
+    ('er',   '_r->_+er',       True,  5),   # baker -> bake er
+    ('er',   '_er->_+er',      True,  5),   # mixer -> mix er
+    ('ed',   '_ied->_y+ed',    True,  5),   # carried -> carry ed
+    ('ed',   '_?ed->_+ed',     True,  5),   # canned -> can ed
+    ('ed',   '_d->_+ed',       True,  5),   # baked -> bake ed
+    ('ed',   '_ed->_+ed',      True,  5),   # mixed -> mix ed
+]
+
+# words with these endings skip the ending's rules, and move on to the next ending they have
+LEMMA_EXCLUSIONS = {
+    's' : ['ss', 'ous'],
+}
+
+
+class Lemmatizer:
+    def __init__(self, rules = LEMMA_RULES, exclusions = LEMMA_EXCLUSIONS):
+        self.rules = []
+        self.exclusions = {}
+        self.endings = {}           # ending -> (its place in the order, exclusions, compiled rules)
+        self.ending_lengths = []    # lengths of every ending, longest first
+        self.key_length = 0         # which rules a word gets only depends on this many of its last letters
+        self.rule_cache = {}        # last letters -> rules
+
+        for ending, lemma_rule, check, min_length in rules:
+            self.add_rule(ending, lemma_rule, check, min_length)
+        for ending, excluded in exclusions.items():
+            for exclusion in excluded:
+                self.add_exclusion(ending, exclusion)
+
+    # a new ending goes after every ending added before it, a new rule after the ending's other rules
+    def add_rule(self, ending, lemma_rule, check = True, min_length = 5):
+        if ending not in self.endings:
+            self.endings[ending] = (len(self.endings), [], [])
+            self.ending_lengths = sorted(set(self.ending_lengths) | {len(ending)}, reverse = True)
+            self.key_length = max(self.key_length, len(ending))
+            self.rule_cache = {}
+
+        self.rules.append((ending, lemma_rule, check, min_length))
+        self.endings[ending][2].append(compile_lemma_rule(lemma_rule, check, min_length))
+
+    def add_exclusion(self, ending, exclusion):
+        if ending not in self.endings:
+            raise Exception(f'No rules for the ending \'{ending}\'')
+        self.exclusions.setdefault(ending, []).append(exclusion)
+        self.endings[ending][1].append(exclusion)
+        self.key_length = max(self.key_length, len(exclusion))
+        self.rule_cache = {}
+
+    # the rules of the first ending (in order) the word has, and isn't excluded from
+    def get_rules(self, word):
+        key = word[-self.key_length:]
+        rules = self.rule_cache.get(key)
+        if rules is None:
+            rules = self.rule_cache[key] = self.find_rules(key)
+        return rules
+
+    def find_rules(self, word):
+        found = None
+
+        for length in self.ending_lengths:
+            ending = self.endings.get(word[-length:])
+            if ending is None or (found is not None and ending[0] > found[0]):
+                continue
+            if any(word.endswith(exclusion) for exclusion in ending[1]):
+                continue
+            found = ending
+
+        return () if found is None else found[2]
+
+    # cleanliness -> ('cleanlines', 's'), or None if no rule fits
+    def lemmatize(self, word, vocab = ()):
+        return self.lemmatize_words([word], vocab).get(word)
+
+    # word -> how to split it, for every word that can be lemmatized
+    # (vocab should be a set, or anything else with a fast 'in')
+    def lemmatize_words(self, words, vocab = ()):
+        lemmatized = {}
+
+        get_rules = self.get_rules
+
+        for word in words:
+            for suffix, doubled, new_suffix, check, min_length, product in get_rules(word):
+                if len(word) < min_length or not word.endswith(suffix):
+                    continue
+
+                clip_word = word[:len(word) - len(suffix) - doubled]
+                if doubled and word[len(clip_word)] != clip_word[-1]:
+                    continue
+
+                if check and clip_word + new_suffix not in vocab:
+                    continue
+
+                lemmatized[word] = product(clip_word)
+                break
+
+        return lemmatized
+
+
+# '_?ing->_+ing' -> ('ing', 1, '', True, 5, product), where product('hit') is the same as lemmatize('hitting', '_?ing->_+ing')
+def compile_lemma_rule(lemma_rule, check = True, min_length = 5):
+    if '->' not in lemma_rule:
+        raise Exception(f'Invalid lemma rule: \'{lemma_rule}\', rules look like \'_ies->_y+s\'')
+
+    in_word, out_word = lemma_rule.split('->')
+    suffix = in_word[1:]
+    doubled = int(suffix[:1] == '?')
+    suffix = suffix[doubled:]
+    out_word = out_word[1:]
+
+    if '+' in out_word:
+        new_suffix, out_word = out_word.split('+')
+        product = lambda clip_word: (clip_word + new_suffix, out_word)
+    else:
+        new_suffix = out_word
+        product = lambda clip_word: [clip_word + new_suffix]
+
+    return suffix, doubled, new_suffix, check, max(min_length, len(suffix) + doubled + 1), product
\ No newline at end of file
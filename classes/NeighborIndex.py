@@ -0,0 +1,119 @@
+import scipy.sparse
+import numpy as np
+
+from classes.utils import *
+
+################ The NeighborIndex Class ################
+#
+# - Finds the k words that rate highest against a word or vector, for the 'min' and 'min/max' modes,
+#   without rating every word
+# - Keeps a posting list per context word (the words with a non-zero value for it, as a csc matrix),
+#   plus the highest value in each posting list and a bound on each word's rating
+# - A word can only rate above 0 if it shares a context word with the query, so only the posting lists
+#   of the query's context words are read, biggest possible share first. once the share left to add up
+#   can't lift an unseen word into the top k, the rest are skipped
+# - The words left over are rated exactly, so results are the same as rating every word
+# - Needs a matrix with no negative values (like every CRV matrix made from a corpus)
+
+
+class NeighborIndex:
+    def __init__(self, vectorizer):
+        # (a quantized matrix is turned back into floats, since the bounds are worked out on floats)
+        matrix = scipy.sparse.csr_matrix(vectorizer.dequantize(vectorizer.matrix))
+        if matrix.nnz and matrix.data.min() < 0:
+            raise Exception('A NeighborIndex needs a matrix with no negative values')
+
+        self.vectorizer = vectorizer
+        self.rows    = matrix
+        self.columns = matrix.tocsc()
+
+        # the most any value in a posting list can add to a rating, and the most a word can rate
+        # ('min' can't rate above a word's sum, 'min/max' can't rate above its number of values)
+        self.column_maxes = np.asarray(self.columns.max(axis = 0).todense()).ravel()
+        self.row_sums  = np.bincount(np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr)), weights = matrix.data, minlength = matrix.shape[0])
+        self.row_sizes = np.diff(matrix.indptr).astype(np.float64)
+
+    # the k best rated words for a word / vector, as (indices, scores) arrays best first, like rate_words_batch
+    def query(self, item, k = 20, mode = 'min'):
+        vector = self.vectorizer.to_vector(item)
+        k = min(k, self.rows.shape[0])
+
+        if mode not in ('min', 'min/max'):
+            raise Exception(f'Invalid rating mode for a NeighborIndex {mode}, use \'min\' or \'min/max\'')
+        if np.any(vector < 0):
+            raise Exception('A NeighborIndex can only be queried with vectors with no negative values')
+
+        support = np.flatnonzero(vector)
+        values  = vector[support]
+
+        # when the query's posting lists hold most of the matrix anyway, it's quicker to rate every word
+        if 2 * np.sum(self.columns.indptr[support + 1] - self.columns.indptr[support]) > self.rows.nnz:
+            indices, scores = top_k(self.vectorizer.rate_sparse_rows(self.rows, vector, mode)[None], k)
+            return indices[0], scores[0]
+
+        # the most each of the query's context words can add to any rating
+        if mode == 'min':
+            bounds = np.minimum(self.column_maxes[support], values)
+            row_bounds = self.row_sums
+        else:
+            bounds = np.minimum(self.column_maxes[support] / values, 1)
+            row_bounds = self.row_sizes
+
+        order = np.argsort(-bounds, kind = 'stable')
+        support, values, bounds = support[order], values[order], bounds[order]
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1][1:], [0]])
+
+        # ratings so far (only from the posting lists read), which only go up as more are read
+        # every value read is above 0, so the words seen so far are the ones rated above 0
+        # posting lists are read in batches of 1, 1, 2, 4, 8... with a check for stopping after each
+        partial = np.zeros(self.rows.shape[0])
+        seen = np.zeros(0, dtype = np.int64)
+        threshold = 0
+        start, end = 0, 0
+
+        while end < len(support):
+            start, end = end, min(max(2 * end, 1), len(support))
+
+            column_starts = self.columns.indptr[support[start : end]]
+            lengths = self.columns.indptr[support[start : end] + 1] - column_starts
+            positions = np.repeat(column_starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+            rows, column_values = self.columns.indices[positions], self.columns.data[positions]
+            query_values = np.repeat(values[start : end], lengths)
+
+            if mode == 'min':
+                shares = np.minimum(column_values, query_values)
+            else:
+                shares = np.minimum(column_values, query_values) / np.maximum(column_values, query_values)
+            partial += np.bincount(rows, weights = shares, minlength = len(partial))
+            seen = np.flatnonzero(partial)
+
+            # the k-th best rating so far is a lower bound on the k-th best rating,
+            # once nothing left to read can reach it, unseen words can't make the top k
+            # (less a little, so rounding never drops a word that ties it)
+            if len(seen) >= k:
+                threshold = np.partition(partial[seen], len(seen) - k)[len(seen) - k] - 1e-9
+            if remaining[end - 1] < threshold:
+                break
+
+        # with every posting list read, the ratings so far are the exact ratings
+        if end == len(support):
+            indices, scores = top_k(partial[None], k)
+            return indices[0], scores[0]
+
+        left = remaining[end - 1]
+        candidates = seen[np.minimum(partial[seen] + left, row_bounds[seen]) >= threshold]
+
+        # every other word rates 0, so any left to fill the k places come in order of index
+        if len(candidates) < k:
+            others = np.setdiff1d(np.arange(k + len(candidates)), candidates)[: k - len(candidates)]
+            candidates = np.concatenate([candidates, others])
+
+        ratings = self.vectorizer.rate_sparse_rows(self.rows[candidates], vector, mode)
+        indices, scores = top_k(ratings[None], k, candidates[None])
+        return indices[0], scores[0]
+
+    def query_batch(self, queries, k = 20, mode = 'min'):
+        results = [self.query(query, k, mode) for query in queries]
+        k = min(k, self.rows.shape[0])
+        return np.array([indices for indices, _ in results]).reshape(-1, k), np.array([scores for _, scores in results]).reshape(-1, k)
\ No newline at end of file
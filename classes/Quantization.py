@@ -0,0 +1,116 @@
+import scipy.sparse
+import numpy as np
+
+################ Quantized CRV Storage ################
+#
+# - Stores a CRV matrix in 2 or 1 bytes a value instead of 8:
+#   'uint16' / 'uint8' are fixed point (value = stored integer * scale), 'float16' is a half precision float
+#   ('uint8' is coarse: a value under half a step is stored as 0, so it's for quick rough ratings)
+# - Fixed point uses one scale for the whole matrix (its largest value is the largest integer), so any two
+#   rows, or a row and a query quantized the same way, can be compared as integers without rescaling
+# - 'min' and 'diff' are rated straight on the stored values, so only a quarter / eighth of the bytes are read
+#
+# Error bounds (a rating's distance from the same rating on the float64 matrix):
+# - fixed point: every value is rounded to the nearest multiple of scale, so it's off by at most scale / 2.
+#   min(a, b) is then off by at most scale / 2, and |a - b| by at most scale, for each column where
+#   the row or the query isn't zero (zeros are stored exactly):
+#     'min'  : <= columns * scale / 2
+#     'diff' : <= columns * scale
+#   (for CRV rows scale is at most 1 / 65535 for 'uint16', 1 / 255 for 'uint8')
+# - 'float16' (dense matrices only): every value is off by at most 2^-11 of itself (or 2^-25 if it's below 2^-14),
+#   so for rows and queries that sum to 1 at most:
+#     'min'  : 2^-10 + columns * 2^-25
+#     'diff' : 2^-10 + columns * 2^-24
+# - rows and queries that sum to 1 rate in [0, 1] for 'min' and [-1, 1] for 'diff', so no bound is more than 1 for 'min'
+#   and 2 for 'diff'. For 'uint8' the bound is often just this cap: it says little, and 'min' ratings on
+#   diplomacy were seen off by up to 0.33
+# - a 'min' column where the query is zero rates 0 either way, so 'min' only counts the query's non-zero columns
+# - the other modes are rated on the values turned back into floats, with the same per-value error
+
+
+QUANTIZATIONS = {
+    'uint16'  : np.uint16,
+    'uint8'   : np.uint8,
+    'float16' : np.float16,
+}
+
+def get_quantized_dtype(quantization):
+    if quantization not in QUANTIZATIONS:
+        raise Exception(f'Invalid quantization {quantization}, use one of {list(QUANTIZATIONS)}')
+    return np.dtype(QUANTIZATIONS[quantization])
+
+def is_fixed_point(quantization):
+    return get_quantized_dtype(quantization).kind == 'u'
+
+# the size of one step of the stored integers, so the largest value of the matrix is the largest integer
+def get_quantization_scale(matrix, quantization):
+    if not is_fixed_point(quantization):
+        return 1.0
+
+    values = matrix.data if scipy.sparse.issparse(matrix) else matrix
+    largest = float(np.max(values)) if values.size else 0.0
+    return largest / np.iinfo(get_quantized_dtype(quantization)).max if largest > 0 else 1.0
+
+# values -> stored values; fixed point can't store negative values
+def quantize_values(values, quantization, scale):
+    dtype = get_quantized_dtype(quantization)
+    if not is_fixed_point(quantization):
+        return np.asarray(values).astype(dtype)
+
+    if np.any(np.asarray(values) < 0):
+        raise Exception(f'Cannot store negative values as {quantization}')
+    return np.minimum(np.rint(np.asarray(values) / scale), np.iinfo(dtype).max).astype(dtype)
+
+def quantize_matrix(matrix, quantization, scale):
+    if scipy.sparse.issparse(matrix):
+        if not is_fixed_point(quantization):
+            raise Exception(f'Sparse matrices can\'t be stored as {quantization}, use \'uint16\' or \'uint8\'')
+        matrix = scipy.sparse.csr_matrix(matrix)
+        return scipy.sparse.csr_matrix((quantize_values(matrix.data, quantization, scale), matrix.indices, matrix.indptr), shape = matrix.shape)
+    return quantize_values(matrix, quantization, scale)
+
+# stored values (dense or sparse) -> float64 values
+def dequantize_matrix(matrix, scale):
+    if scipy.sparse.issparse(matrix):
+        return scipy.sparse.csr_matrix((matrix.data.astype(np.float64) * scale, matrix.indices, matrix.indptr), shape = matrix.shape)
+    return np.asarray(matrix).astype(np.float64) * scale
+
+# the most a 'min' or 'diff' rating can be off by, for a row and query with this many non-zero columns between them
+# (columns can be an array, for a bound per row)
+def get_quantization_error(quantization, scale, mode = 'min', columns = 1):
+    if mode not in ('min', 'diff'):
+        raise Exception(f'Error bounds are only worked out for \'min\' and \'diff\', not {mode}')
+
+    steps = 1 if mode == 'min' else 2
+    if is_fixed_point(quantization):
+        bound = steps * np.asarray(columns) * scale / 2
+    else:
+        bound = 2 ** -10 + steps * np.asarray(columns) * 2 ** -25
+    return np.minimum(bound, steps) if bound.ndim else min(float(bound), steps)
+
+# rate quantized rows against a query that was quantized the same way, as integers (or float16s)
+# for 'min' and 'diff'; returns float64 ratings on the same scale as the float path
+def rate_quantized_rows(rows, query, mode, scale):
+    total_dtype = np.uint64 if query.dtype.kind == 'u' else np.float64
+
+    if scipy.sparse.issparse(rows):
+        values = rows.data
+        nearby = query[rows.indices]
+        row_ids = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+
+        def row_sums(per_value):
+            return np.bincount(row_ids, weights = per_value, minlength = rows.shape[0])
+
+        # there are no negative values, so a column the row doesn't store rates min 0, and diff the query's value
+        if mode == 'min':
+            return row_sums(np.minimum(values, nearby)) * scale
+
+        differences = np.maximum(values, nearby) - np.minimum(values, nearby)
+        totals = row_sums(differences) - row_sums(nearby) + float(np.sum(query, dtype = total_dtype))
+        return 1 - totals * scale
+
+    if mode == 'min':
+        return np.minimum(rows, query).sum(axis = 1, dtype = total_dtype) * scale
+
+    differences = np.maximum(rows, query) - np.minimum(rows, query)
+    return 1 - differences.sum(axis = 1, dtype = total_dtype) * scale
\ No newline at end of file
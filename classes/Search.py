@@ -0,0 +1,132 @@
+from collections.abc import Sequence
+from collections import Counter
+import numpy as np
+
+from classes.utils import *
+
+################ Corpus Search ################
+#
+# - Keeps where every word appears (a positional index), as one array of token positions grouped by word
+# - Finds groups of words within a few words of each other by merging the positions of just those words
+# - Returns matches as a Concordance: a lazy, pageable list of keyword-in-context snippets,
+#   where a snippet is only built when it's looked at
+
+
+class PositionalIndex:
+    def __init__(self, tokens, offsets, vocab_size):
+        self.offsets = offsets
+
+        # the positions of word i are positions[starts[i] : starts[i + 1]], in order
+        # (a stable sort keeps each word's positions in the order they appear)
+        self.positions = np.argsort(tokens, kind = 'stable')
+        self.starts = np.concatenate([[0], np.cumsum(np.bincount(tokens, minlength = vocab_size))])
+
+    def get_positions(self, word_id):
+        return self.positions[self.starts[word_id] : self.starts[word_id + 1]]
+
+    # the sentence each token position is in
+    def get_sentence_ids(self, positions):
+        return np.searchsorted(self.offsets, positions, side = 'right') - 1
+
+    # every place the words (ids, repeats count) are all within max_seperation words of each other in one sentence
+    # windows start at one of the words, and a window is left out only if it uses a word position an earlier match
+    # already used, so every occurrence of a single word is a match
+    # returns the start and end (one past the last searched word) of each match
+    def find(self, word_ids, max_seperation = 3):
+        needed = Counter(word_ids)
+        postings = {word_id : self.get_positions(word_id) for word_id in needed}
+
+        if any(len(postings[word_id]) < count for word_id, count in needed.items()):
+            return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+
+        starts = np.unique(np.concatenate(list(postings.values())))
+        window_ends = np.minimum(starts + max_seperation, self.offsets[self.get_sentence_ids(starts) + 1])
+
+        # the window is a match if it holds each word's count-th position from the start on
+        valid = np.ones(len(starts), dtype = bool)
+        ends = starts + 1
+        firsts = {}
+        for word_id, count in needed.items():
+            positions = postings[word_id]
+            firsts[word_id] = np.searchsorted(positions, starts)
+            nth = firsts[word_id] + count - 1
+            valid &= nth < len(positions)
+            nth_positions = positions[np.minimum(nth, len(positions) - 1)]
+            valid &= nth_positions < window_ends
+            ends = np.maximum(ends, nth_positions + 1)
+
+        starts, ends = starts[valid], ends[valid]
+
+        # a single word's windows are its positions, which never share one
+        if len(word_ids) == 1:
+            return starts.astype(np.int64), ends.astype(np.int64)
+
+        # keep the first of any windows that use the same word positions
+        # (window i uses each word's first count positions from its start on)
+        kept = []
+        used = set()
+        firsts = {word_id : firsts[word_id][valid].tolist() for word_id in needed}
+        for i in range(len(starts)):
+            window = [int(position) for word_id, count in needed.items()
+                      for position in postings[word_id][firsts[word_id][i] : firsts[word_id][i] + count]]
+            if used.isdisjoint(window):
+                kept.append(i)
+                used.update(window)
+
+        return starts[kept].astype(np.int64), ends[kept].astype(np.int64)
+
+
+# the matches of a search, as snippets of print_size words around each match
+class Concordance(Sequence):
+    def __init__(self, starts, ends, tokens, offsets, vocab, mode = 'word', print_size = 20, page_size = 10):
+        self.starts  = starts
+        self.ends    = ends
+        self.tokens  = tokens
+        self.offsets = offsets
+        self.vocab   = vocab
+        self.mode    = mode
+        self.print_size = print_size
+        self.page_size  = page_size
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('match index out of range')
+
+        start, end = int(self.starts[index]), int(self.ends[index])
+        sentence_id = self.get_sentence_ids(start)
+        center = (start + end) // 2
+
+        snippet_start = max(int(self.offsets[sentence_id]), center - self.print_size // 2)
+        snippet_end = min(int(self.offsets[sentence_id + 1]), center + self.print_size // 2)
+        return concat_sentence([self.vocab[token] for token in self.tokens[snippet_start : snippet_end].tolist()], self.mode)
+
+    def get_sentence_ids(self, positions):
+        return np.searchsorted(self.offsets, positions, side = 'right') - 1
+
+    # ids of the sentences with at least one match
+    @property
+    def sentence_ids(self):
+        return set(np.unique(self.get_sentence_ids(self.starts)).tolist())
+
+    @property
+    def page_count(self):
+        return -(-len(self) // self.page_size)
+
+    def page(self, n = 0):
+        return self[n * self.page_size : (n + 1) * self.page_size]
+
+    def __repr__(self):
+        if len(self) == 0:
+            return 'None Found'
+
+        return '\n\n'.join(self.page(0)) + '\n\n' + \
+               f"Total Found : {len(self)}\n" + \
+               f"Found in {len(self.sentence_ids)} sentences"
\ No newline at end of file
@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from spellwise import CaverphoneOne
+from itertools import *
+import os
+
+from classes.utils import *
+from classes.cache import *
+
+################ The SpellCorrector Class ################
+#
+# - Suggests dictionary words that sound like a given word, the same way as spellwise's CaverphoneOne
+#   (every word is encoded into a Caverphone code, and words with the same code are suggestions)
+# - Builds a code -> dictionary words index once, and keeps it in the cache folder
+# - Remembers the code of every word it has seen, across corpora and runs, so each word is only encoded once
+#   (bulk encodes are written to the cache right away, single lookups only once save() is called)
+# - Encodes never-seen words in a process pool
+
+
+CAVERPHONE = CaverphoneOne()
+
+def get_phonetic_codes(words):
+    return [CAVERPHONE._pre_process(word) for word in words]
+
+
+class SpellCorrector:
+    def __init__(self,
+                 dictionary_path,   # a file of words, split by whitespace
+                 cache   = None,    # folder to keep the index and the remembered codes in, nothing is kept if None
+                 workers = None):   # processes used to encode new words
+
+        self.cache   = cache
+        self.workers = workers
+
+        self.codes_path = None if cache is None else os.path.join(cache, 'caverphone_codes.json')
+        self.codes = {} if cache is None else load_json(self.codes_path, {})
+
+        self.index = self.load_index(dictionary_path)
+
+    # code -> dictionary words, read from the cache if this dictionary was indexed before
+    def load_index(self, dictionary_path):
+        index_path = None if self.cache is None else os.path.join(self.cache, f'caverphone_index_{hash_file(dictionary_path)[:32]}.json')
+
+        if index_path is not None and os.path.exists(index_path):
+            return load_json(index_path)
+
+        with open(dictionary_path) as f:
+            words = [word.lower().strip() for word in f.read().split()]
+
+        self.encode(words)
+
+        index = defaultdict(list)
+        for word in words:
+            index[self.codes[word]].append(word)
+
+        if index_path is not None:
+            save_json(index_path, index)
+
+        return index
+
+    # find the codes of all words that were never seen before, in parallel if there are workers
+    def encode(self, words, chunk_size = 10000):
+        new_words = list(dict.fromkeys(word for word in words if word not in self.codes))
+        if len(new_words) == 0:
+            return
+
+        if self.workers is None or self.workers <= 1 or len(new_words) <= chunk_size:
+            codes = get_phonetic_codes(new_words)
+        else:
+            chunks = [new_words[i : i + chunk_size] for i in range(0, len(new_words), chunk_size)]
+            with ProcessPoolExecutor(self.workers) as executor:
+                codes = list(chain.from_iterable(executor.map(get_phonetic_codes, chunks)))
+
+        self.codes.update(zip(new_words, codes))
+        self.save()
+
+    # writes the remembered codes to the cache folder
+    def save(self):
+        if self.codes_path is not None:
+            save_json(self.codes_path, self.codes)
+
+    # (a single word is only remembered in memory, rewriting the whole cache file for it costs far more than encoding it)
+    def get_code(self, word):
+        if word not in self.codes:
+            self.codes[word] = get_phonetic_codes([word])[0]
+        return self.codes[word]
+
+    # dictionary words that sound like the given word
+    def get_suggestions(self, word):
+        return self.index.get(self.get_code(word), [])
@@ -1,6 +1,14 @@
 import matplotlib.pyplot as plt
 from itertools import *
+from concurrent.futures import ProcessPoolExecutor
+from collections.abc import Sequence, Mapping
+from functools import lru_cache
+import bisect
+from array import array
 import numpy as np
+import hashlib
+import json
+import re
 
 ################ Dictionary Management ################
 
@@ -27,6 +35,37 @@ def sort_len_hl(d):
 def sort_len_lh(d):
     return sort_dict(d, lambda item: (len(item[1]), item[0]))
 
+# the k highest scores in each row of a 2d array, as (indices, scores) arrays sorted high to low (ties by index)
+# only the scores that tie or beat each row's k-th best get sorted, the rest are just partitioned off
+def top_k(scores, k, indices = None):
+    scores  = np.where(np.isnan(scores), -np.inf, scores)
+    indices = np.broadcast_to(np.arange(scores.shape[1]) if indices is None else indices, scores.shape)
+    row_count, size = scores.shape
+
+    if k < size:
+        kth_best = np.partition(scores, size - k, axis = 1)[:, size - k, None]
+        rows, columns = np.nonzero(scores >= kth_best)
+    else:
+        rows, columns = np.nonzero(np.ones(scores.shape, dtype = bool))
+
+    scores, indices = scores[rows, columns], indices[rows, columns]
+    order = np.lexsort((indices, -scores, rows))
+
+    # the first k of each row
+    rows = rows[order]
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, np.arange(row_count))[rows]
+    order = order[ranks < min(k, size)]
+    return indices[order].reshape(row_count, -1), scores[order].reshape(row_count, -1)
+
+# the top k of several (indices, scores) results for the same rows, combined
+def merge_top_k(results, k):
+    merged = None
+    for indices, scores in results:
+        if merged is not None:
+            indices, scores = np.concatenate([merged[0], indices], axis = 1), np.concatenate([merged[1], scores], axis = 1)
+        merged = top_k(scores, k, indices)
+    return merged
+
 # cleaning dicts
 
 def round_dict(dictionary, digits = 2):
@@ -40,6 +79,77 @@ def clean_dict(dictionary, length = 50, digits = 2):
 
 
 
+# word lists stored as plain arrays
+
+# a read-only list of strings, stored as one utf-8 byte array plus where each string starts,
+# with the strings' sorted order for lookups. being plain arrays, it can be saved and memory mapped
+class StringTable(Sequence):
+    def __init__(self, blob, offsets, order):
+        self.blob    = blob
+        self.offsets = offsets
+        self.order   = order
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [string.encode('utf-8', 'surrogatepass') for string in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype = np.int64)
+        offsets[1:] = np.cumsum([len(string) for string in encoded])
+        order = sorted(range(len(strings)), key = strings.__getitem__)
+
+        return cls(np.frombuffer(b''.join(encoded), dtype = np.uint8), offsets, np.array(order, dtype = np.int64))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('string index out of range')
+
+        return self.blob[self.offsets[index] : self.offsets[index + 1]].tobytes().decode('utf-8', 'surrogatepass')
+
+    # binary search through the sorted order
+    def index(self, string):
+        position = bisect.bisect_left(self.order, string, key = lambda i: self[i])
+        if position == len(self.order) or self[self.order[position]] != string:
+            raise ValueError(f'{string!r} is not in the table')
+        return int(self.order[position])
+
+    def __contains__(self, string):
+        try:
+            self.index(string)
+            return True
+        except ValueError:
+            return False
+
+# a read-only string -> index mapping over a StringTable, in place of a dict
+class StringIndex(Mapping):
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, string):
+        try:
+            return self.table.index(string)
+        except ValueError:
+            raise KeyError(string)
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __len__(self):
+        return len(self.table)
+
+# string -> index lookups for a list of strings
+def get_indices(strings):
+    if isinstance(strings, StringTable):
+        return StringIndex(strings)
+    return {string : i for i, string in enumerate(strings)}
+
+
 # a handy decorator, lets a function accept an item, many items, or a list of items, and returns it in the same format
 def argmap(func, class_method = True):
   
@@ -77,6 +187,93 @@ def argmap(func, class_method = True):
 
     return wrapper
 
+# split an array (sliced, so a memory mapped array is only read a chunk at a time) or any iterable
+# into int64 arrays of up to chunk_size items
+def iter_chunks(items, chunk_size = 4096):
+    if isinstance(items, np.ndarray):
+        for start in range(0, len(items), chunk_size):
+            yield np.asarray(items[start : start + chunk_size], dtype = np.int64)
+        return
+
+    items = iter(items)
+    while True:
+        chunk = np.fromiter(islice(items, chunk_size), dtype = np.int64)
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+################ File Loading ################
+
+# yields the items of a json array, or the values of a json lines file, one at a time
+# only a chunk of the file is held in memory, so large files can be streamed
+# lines = None guesses the format from the first character, True forces json lines
+def iter_json_records(filepath, lines = None, chunk_size = 1 << 20):
+    decoder  = json.JSONDecoder()
+    is_array = None if lines is None else not lines
+
+    with open(filepath, encoding = 'utf-8') as f:
+        buffer, position, eof = '', 0, False
+        opened = False
+
+        while True:
+            # skip whitespace, and the commas between the items of an array
+            while position < len(buffer) and (buffer[position].isspace() or (is_array and buffer[position] == ',')):
+                position += 1
+
+            # everything in the buffer has been used, read the next chunk
+            if position == len(buffer):
+                if eof:
+                    if is_array:
+                        raise ValueError(f'Unterminated json array in {filepath}')
+                    return
+
+                buffer, position = f.read(chunk_size), 0
+                eof = buffer == ''
+                continue
+
+            # the opening bracket of an array is only expected once, before any records
+            if not opened:
+                opened   = True
+                is_array = buffer[position] == '[' if is_array is None else is_array
+                if is_array:
+                    if buffer[position] != '[':
+                        raise ValueError(f'Expected a json array in {filepath}')
+                    position += 1
+                continue
+
+            if is_array and buffer[position] == ']':
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                complete = eof or end < len(buffer) and (buffer[end].isspace() or buffer[end] in ',]')
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            # the record may be cut off by the end of the buffer (a cut off number like
+            # '3.' still decodes, so it has to be followed by a separator), read more and try again
+            if not complete:
+                chunk = f.read(chunk_size)
+                eof   = chunk == ''
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+
+            position = end
+            yield record
+
+# corpora are given without '.json'; json lines files keep their '.jsonl'
+def get_json_path(filepath):
+    if filepath[-5:] != '.json' and filepath[-6:] != '.jsonl':
+        filepath += '.json'
+    return filepath
+
+# a compact fingerprint of a sentence, so duplicates can be found without keeping every sentence around
+def hash_sentence(sentence):
+    return hashlib.blake2b(sentence.encode('utf-8', 'surrogatepass'), digest_size = 16).digest()
+
 
 ################ Data visualization ################
 
@@ -152,6 +349,57 @@ def print_scanned_text(scanned_text, normalize = True):
 SKIP_CHARS   = ' '
 CONCAT_CHARS = 'qwertyuiopasdfghjklzxcvbnmàáâãäåæçèéêëìíîïðñòóôõöøùúûüýÿ'
     
+# splits sentences into words or characters
+# - words are runs of concat chars; any other char that isn't a skip char is its own word
+# - the rules are compiled into one regex, so the splitting happens in C instead of char by char
+class Tokenizer:
+    def __init__(self,
+                 mode         = 'word',
+                 skip_chars   = None,
+                 concat_chars = None,
+                 add_border_tokens = True):
+
+        self.mode = mode
+        self.skip_chars   = skip_chars   or SKIP_CHARS
+        self.concat_chars = concat_chars or CONCAT_CHARS
+        self.add_border_tokens = add_border_tokens
+
+        # concat chars are checked first, so a char in both sets is part of a word
+        concat_class = ''.join(re.escape(char) for char in sorted(set(self.concat_chars)))
+        skip_class   = ''.join(re.escape(char) for char in sorted(set(self.skip_chars)))
+        self.pattern = re.compile(f'[{concat_class}]+|[^{skip_class}]')
+
+    def split(self, sentence):
+        if self.mode == 'char':
+            splitted_sentence = list(sentence)
+        elif self.mode == 'word':
+            splitted_sentence = self.pattern.findall(sentence)
+        else:
+            raise Exception(f'Invalid text mode {self.mode}, should be \'word\' or \'char\'')
+
+        if self.add_border_tokens:
+            return ['<START>'] + splitted_sentence + ['<END>']
+        else:
+            return splitted_sentence
+
+    def split_chunk(self, sentences):
+        return [self.split(sentence) for sentence in sentences]
+
+    # split many sentences at once, optionally spread over a pool of processes
+    def split_all(self, sentences, workers = None, chunk_size = 10000):
+        if workers is None or workers <= 1:
+            return self.split_chunk(sentences)
+
+        chunks = [sentences[i : i + chunk_size] for i in range(0, len(sentences), chunk_size)]
+        with ProcessPoolExecutor(workers) as executor:
+            return list(chain.from_iterable(executor.map(self.split_chunk, chunks)))
+
+
+# tokenizers are cached, so the regex is only compiled once per set of options
+@lru_cache(maxsize = 32)
+def get_tokenizer(mode = 'word', skip_chars = None, concat_chars = None, add_border_tokens = True):
+    return Tokenizer(mode, skip_chars, concat_chars, add_border_tokens)
+
 # split a sentence into words or characters
 def split_sentence(
         sentence,
@@ -160,39 +408,154 @@ def split_sentence(
         concat_chars = None,
         add_border_tokens = True):
 
-    if mode == 'char':
-        splitted_sentence = list(sentence)
-        
-    elif mode == 'word':
+    return get_tokenizer(mode, skip_chars, concat_chars, add_border_tokens).split(sentence)
 
-        skip_chars   = skip_chars   or SKIP_CHARS
-        concat_chars = concat_chars or CONCAT_CHARS
-
-        splitted_sentence = []
-        current_word      = ''
-
-        # adding a whitespace to the end will make it add the current word at the end
-        for char in sentence + " ":
-
-            if char in concat_chars:
-                current_word += char
-                continue
-
-            # the current word is not in concat_chars now
-            
-            # add the current word if it's not empty
-            if current_word != '':
-                splitted_sentence.append(current_word)
-                current_word = ''
-
-            # if this is not a skip char, append it as its own word
-            if char not in skip_chars:
-                splitted_sentence.append(char)
-
-    if add_border_tokens:
-        return ['<START>'] + splitted_sentence + ['<END>']
-    else:
-        return splitted_sentence
+# split a list of sentences, with workers > 1 the work is split across processes
+def split_sentences(
+        sentences,
+        mode         = 'word',
+        skip_chars   = None,
+        concat_chars = None,
+        add_border_tokens = True,
+        workers      = None):
+
+    return get_tokenizer(mode, skip_chars, concat_chars, add_border_tokens).split_all(sentences, workers)
+
+# turn sentences (lists of words) into one flat array of word ids, plus the offset where each sentence starts
+# each word is interned once, in order of first appearance; also returns the id -> word list and word -> id dict
+def encode_sentences(sentences, indices = None):
+    indices = {} if indices is None else indices
+    tokens  = array('i')
+    offsets = array('q', [0])
+
+    for sentence in sentences:
+        tokens.extend([indices.setdefault(word, len(indices)) for word in sentence])
+        offsets.append(len(tokens))
+
+    return np.frombuffer(tokens, dtype = np.int32), np.frombuffer(offsets, dtype = np.int64), list(indices), indices
+
+# border tokens get codes just past the last unicode code point, so they can't clash with a char
+CHAR_BORDER_CODES = {'<START>' : 0x110000, '<END>' : 0x110001}
+
+# the same as encode_sentences(split_sentences(sentences, 'char')), straight from strings:
+# - each sentence is copied into one buffer of code points, so no list of chars is ever made
+# - a char's id comes from a table over every possible code point (counted with bincount), not a dict
+# ids are in order of code point instead of first appearance
+def encode_char_sentences(sentences, add_border_tokens = True):
+    start, end = (np.array([CHAR_BORDER_CODES[token]], dtype = np.uint32).tobytes() for token in ('<START>', '<END>'))
+    border_size = 2 if add_border_tokens else 0
+
+    blob = bytearray()
+    lengths = array('q')
+    for sentence in sentences:
+        if add_border_tokens:
+            blob += start
+        # (lone surrogates, which json allows, are kept as they are)
+        blob += sentence.encode('utf-32-le', 'surrogatepass')
+        if add_border_tokens:
+            blob += end
+        lengths.append(len(sentence) + border_size)
+
+    codes = np.frombuffer(blob, dtype = np.uint32)
+    offsets = np.concatenate([[0], np.cumsum(np.frombuffer(lengths, dtype = np.int64))]).astype(np.int64)
+
+    present = np.flatnonzero(np.bincount(codes, minlength = 0x110002))
+    ids = np.zeros(0x110002, dtype = np.int32)
+    ids[present] = np.arange(len(present), dtype = np.int32)
+
+    border_tokens = {code : token for token, code in CHAR_BORDER_CODES.items()}
+    vocab = [border_tokens.get(code) or chr(code) for code in present.tolist()]
+    return ids[codes], offsets, vocab, {char : i for i, char in enumerate(vocab)}
+
+# the id of the sentence each token belongs to
+def get_sentence_ids(offsets):
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+# follow chained replacements (a -> [b], b -> [c, d]) once, up front: word -> the words it ends up as
+# a word that would turn back into itself (a -> [b], b -> [a]) stops being replaced there
+def resolve_replacements(replacements):
+    resolved = {}
+
+    def resolve(word, seen):
+        if word not in replacements or word in seen:
+            return (word,)
+        if word not in resolved:
+            seen.add(word)
+            resolved[word] = tuple(chain.from_iterable(resolve(new_word, seen) for new_word in replacements[word]))
+            seen.discard(word)
+        return resolved[word]
+
+    for word in replacements:
+        resolve(word, set())
+    return resolved
+
+# one map that does the same as each of the given maps (followed to their fixed points) in turn
+def compose_replacements(replacement_maps):
+    composed = {}
+    for replacements in replacement_maps:
+        resolved = resolve_replacements(replacements)
+        composed = {word : tuple(chain.from_iterable(resolved.get(new_word, (new_word,)) for new_word in new_words))
+                    for word, new_words in composed.items()}
+        composed.update({word : new_words for word, new_words in resolved.items() if word not in composed})
+    return composed
+
+# replace words with lists of words (cleanliness -> clean ly ness) in sentences encoded by encode_sentences,
+# all sentences at once: every id gets the ids it turns into, and the tokens are gathered from that table
+# each word is replaced once (see resolve_replacements / compose_replacements for chained replacements)
+# returns the same as encode_sentences would for the replaced sentences (ids in order of first appearance)
+def replace_tokens(tokens, offsets, vocab, replacements):
+    indices = {word : i for i, word in enumerate(vocab)}
+
+    # id -> ids, as one flat array + where each id's ids start
+    table = [[indices.setdefault(new_word, len(indices)) for new_word in replacements[word]] if word in replacements else [i]
+             for i, word in enumerate(vocab)]
+    table_lengths = np.array([len(ids) for ids in table], dtype = np.int64)
+    table_offsets = np.concatenate([[0], np.cumsum(table_lengths)])
+    table = np.fromiter(chain.from_iterable(table), dtype = np.int32, count = int(table_offsets[-1]))
+
+    # each token becomes table_lengths[token] tokens
+    lengths = table_lengths[tokens]
+    token_offsets = np.concatenate([[0], np.cumsum(lengths)])
+    positions = np.repeat(table_offsets[tokens] - token_offsets[:-1], lengths) + np.arange(token_offsets[-1])
+    tokens  = table[positions]
+    offsets = token_offsets[offsets]
+
+    # renumber by first appearance, dropping words that were replaced everywhere
+    vocab = list(indices)
+    ids, first_positions = np.unique(tokens, return_index = True)
+    ids = ids[np.argsort(first_positions)]
+    new_ids = np.full(len(vocab), -1, dtype = np.int32)
+    new_ids[ids] = np.arange(len(ids), dtype = np.int32)
+
+    vocab = [vocab[i] for i in ids.tolist()]
+    return new_ids[tokens], offsets, vocab, {word : i for i, word in enumerate(vocab)}
+
+# a read-only list of sentences stored as flat word ids + sentence offsets
+# sentences are only turned back into lists of words when they are looked at
+class SentenceList(Sequence):
+    def __init__(self, tokens, offsets, vocab):
+        self.tokens  = tokens
+        self.offsets = offsets
+        self.vocab   = vocab
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('sentence index out of range')
+
+        return [self.vocab[token] for token in self.tokens[self.offsets[index] : self.offsets[index + 1]].tolist()]
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield [self.vocab[token] for token in self.tokens[start : end].tolist()]
 
 # concatenate a list of words or chracters into a string
 def concat_sentence(sentence, mode = 'word'):
@@ -1,26 +1,204 @@
+from concurrent.futures import ThreadPoolExecutor
 from itertools import *
+import scipy.sparse
 import numpy as np
+import json
+import os
 
 from classes.utils import *
 from classes.crv import *
+from classes.counting import *
+from classes.neighborindex import *
+from classes.quantization import *
 
 ################ The Vectorizer Class ################
 #
 # - Quickly compares words to each other and converts between formats
-# - Stores a matrix of word: co-occurence frequency with others
+# - Stores a matrix of word: co-occurence frequency with others (a dense array, or a sparse csr matrix)
 # - Stores a vocabulary of all encoded words
 # - Stores a vocabulary of all words used for encoding
+# - Optionally keeps the raw tallies behind the matrix, so new text can be added to it
+# - Saves to a folder that can be memory mapped, and shared between processes
+# - Finds a word's nearest words without rating every word (see classes/NeighborIndex.py)
+# - Can store its matrix in 2 or 1 bytes a value, rated without turning it back into floats (see classes/Quantization.py)
 
 class Vectorizer:
-    def __init__(self, vocab, matrix, embedding_vocab = None):
+    def __init__(self, vocab, matrix, embedding_vocab = None, counts = None, window_size = None, quantization = None, scale = 1.0):
         self.vocab = vocab
         self.embedding_vocab = embedding_vocab or vocab
 
+        # how the matrix is stored ('uint16', 'uint8', 'float16' or None for float64),
+        # and the value of one step of a fixed point matrix
+        self.quantization = quantization
+        self.scale = scale
+
         self.matrix = matrix
-        self.vsize, self.csize = self.matrix.shape
 
-        self.indices = {word : i for i, word in enumerate(self.vocab)}
-        self.embedding_indices = {word : i for i, word in enumerate(self.embedding_vocab)}
+        # the tallies the matrix was normalized from, and the window they were counted with
+        self.counts = counts
+        self.window_size = window_size
+
+        self.indices = get_indices(self.vocab)
+        self.embedding_indices = get_indices(self.embedding_vocab)
+        self._crv_ids = None
+
+    # after new tallies are added, the matrix is only normalized again once it's used
+    @property
+    def matrix(self):
+        if self._matrix is None:
+            matrix = normalize_rows(self.counts)
+            self.matrix = matrix if self.sparse else matrix.toarray()
+        return self._matrix
+
+    @matrix.setter
+    def matrix(self, matrix):
+        # sparse matrices only store the non-zero values, which is almost all of a CRV matrix
+        self.sparse  = scipy.sparse.issparse(matrix)
+        self._matrix = scipy.sparse.csr_matrix(matrix) if self.sparse else matrix
+        self._neighbor_index = None
+
+        # a float matrix is quantized as it's set, an already quantized one (like an opened one) is kept as is
+        if self.quantization is not None and matrix.dtype != get_quantized_dtype(self.quantization):
+            self.scale = get_quantization_scale(self._matrix, self.quantization)
+            self._matrix = quantize_matrix(self._matrix, self.quantization, self.scale)
+
+    # store the matrix as 'uint16', 'uint8' or 'float16' (or back as float64 with None)
+    def quantize(self, quantization = 'uint16'):
+        matrix = self.dequantize(self.matrix)
+        self.quantization = quantization
+        self.scale = 1.0
+        self.matrix = matrix
+        return self
+
+    # rows of the matrix as float64 values
+    def dequantize(self, rows):
+        if not self.is_quantized(rows):
+            return rows
+        return dequantize_matrix(rows, self.scale)
+
+    def is_quantized(self, rows):
+        return self.quantization is not None and rows.dtype == get_quantized_dtype(self.quantization)
+
+    # the most a 'min' or 'diff' rating can be off from the float64 rating, from the quantization
+    # - with a vector: 'min' counts the vector's non-zero columns, 'diff' gives one bound per row,
+    #   counting the columns where that row or the vector isn't zero
+    # - without one: a bound for any vector, counting every column
+    def rating_error(self, mode = 'min', vector = None):
+        if self.quantization is None:
+            return 0.0
+        if vector is None:
+            return get_quantization_error(self.quantization, self.scale, mode, self.csize)
+
+        query = self.to_vector(vector) != 0
+        if mode != 'diff':
+            return get_quantization_error(self.quantization, self.scale, mode, int(np.count_nonzero(query)))
+
+        # columns where the row or the vector isn't zero: the row's, plus the vector's the row doesn't have
+        # (a sparse row keeps the values that were rounded to 0, they were non-zero before)
+        if self.sparse:
+            row_ids = np.repeat(np.arange(self.vsize), np.diff(self.matrix.indptr))
+            shared = np.bincount(row_ids, weights = query[self.matrix.indices], minlength = self.vsize)
+            columns = np.diff(self.matrix.indptr) + np.count_nonzero(query) - shared
+        else:
+            columns = np.count_nonzero((self.matrix != 0) | query, axis = 1)
+        return get_quantization_error(self.quantization, self.scale, mode, columns)
+
+    # posting lists for fast top k 'min' and 'min/max' ratings, built the first time they're used
+    @property
+    def neighbor_index(self):
+        if self._neighbor_index is None:
+            self._neighbor_index = NeighborIndex(self)
+        return self._neighbor_index
+
+    # the CRV word id of each embedding word, worked out again only when new embedding words are added
+    @property
+    def crv_ids(self):
+        if self._crv_ids is None or len(self._crv_ids) != self.csize:
+            self._crv_ids = get_crv_ids(self.embedding_vocab)
+        return self._crv_ids
+
+    @property
+    def vsize(self):
+        return len(self.vocab)
+
+    @property
+    def csize(self):
+        return len(self.embedding_vocab)
+
+    # add tallies from new text; new words are new rows and columns at the end
+    def add_counts(self, counts, vocab = (), embedding_vocab = ()):
+        if self.counts is None:
+            raise Exception('This Vectorizer has no tallies to add to')
+
+        # an opened vectorizer's word lists are read-only, so they're copied into normal lists first
+        if isinstance(self.vocab, StringTable) or isinstance(self.embedding_vocab, StringTable):
+            self.vocab, self.embedding_vocab = list(self.vocab), list(self.embedding_vocab)
+            self.indices, self.embedding_indices = get_indices(self.vocab), get_indices(self.embedding_vocab)
+
+        self.indices.update({word : i for i, word in enumerate(vocab, self.vsize)})
+        self.embedding_indices.update({word : i for i, word in enumerate(embedding_vocab, self.csize)})
+        self.vocab = self.vocab + list(vocab)
+        self.embedding_vocab = self.embedding_vocab + list(embedding_vocab)
+
+        self.counts  = resize_counts(self.counts, counts.shape) + counts
+        self._matrix = None
+        self._neighbor_index = None
+
+    # Saving and opening
+
+    # saves to a folder of .npy arrays (word lists included, as StringTables) plus a json file of settings
+    def save(self, path):
+        # sparse matrices are saved with sorted columns, since an opened one is read-only and can't be sorted in place
+        def sparse_arrays(name, matrix):
+            if not matrix.has_sorted_indices:
+                matrix = matrix.sorted_indices()
+            return {f'{name}_data' : matrix.data, f'{name}_indices' : matrix.indices, f'{name}_indptr' : matrix.indptr}
+
+        arrays = {}
+        if self.sparse:
+            arrays.update(sparse_arrays('matrix', self.matrix))
+        else:
+            arrays['matrix'] = np.asarray(self.matrix)
+
+        if self.counts is not None:
+            arrays.update(sparse_arrays('counts', self.counts))
+
+        for name, words in (('vocab', self.vocab), ('embedding_vocab', self.embedding_vocab)):
+            table = words if isinstance(words, StringTable) else StringTable.from_strings(words)
+            arrays.update({f'{name}_blob' : table.blob, f'{name}_offsets' : table.offsets, f'{name}_order' : table.order})
+
+        os.makedirs(path, exist_ok = True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), array)
+
+        with open(os.path.join(path, 'vectorizer.json'), 'w') as f:
+            json.dump({'sparse' : self.sparse, 'has_counts' : self.counts is not None, 'window_size' : self.window_size,
+                       'quantization' : self.quantization, 'scale' : self.scale}, f)
+
+    # with mmap = True nothing is read up front: the arrays are mapped read-only straight from the files,
+    # so opening is instant and every process that opens the same folder shares one copy in the page cache.
+    # word lookups use the saved sorted orders, instead of building dicts
+    @classmethod
+    def open(cls, path, mmap = True):
+        def load(name):
+            return np.load(os.path.join(path, f'{name}.npy'), mmap_mode = 'r' if mmap else None)
+
+        with open(os.path.join(path, 'vectorizer.json')) as f:
+            settings = json.load(f)
+
+        vocab, embedding_vocab = [StringTable(load(f'{name}_blob'), load(f'{name}_offsets'), load(f'{name}_order'))
+                                  for name in ('vocab', 'embedding_vocab')]
+        shape = (len(vocab), len(embedding_vocab))
+
+        def load_sparse(name):
+            return scipy.sparse.csr_matrix((load(f'{name}_data'), load(f'{name}_indices'), load(f'{name}_indptr')), shape = shape)
+
+        matrix = load_sparse('matrix') if settings['sparse'] else load('matrix')
+        counts = load_sparse('counts') if settings['has_counts'] else None
+
+        return cls(vocab, matrix, embedding_vocab, counts = counts, window_size = to_window_size(settings['window_size']),
+                   quantization = settings.get('quantization'), scale = settings.get('scale', 1.0))
+
 
     @argmap
     def vectorize(self, word, mode = 'vec'):
@@ -52,10 +230,10 @@ class Vectorizer:
 
     
     def to_vector(self, item):
-        if type(item) not in (int, str, np.ndarray, CRV):
+        if not isinstance(item, (int, str, np.ndarray, CRV)):
             raise Exception(f'Invalid type to be vector, was {type(item)}')
         
-        if type(item) == np.ndarray:
+        if isinstance(item, np.ndarray):
             if item.shape == (self.csize,):
                 return item
             else:
@@ -66,20 +244,26 @@ class Vectorizer:
         
         elif type(item) == CRV:
             result = np.zeros(self.csize)
-            for word, val in item.items():
-                result[self.embedding_indices[word]] = val
+            result[[self.embedding_indices[word] for word in item.words()]] = item.vals
 
             return result
    
     def to_CRV(self, item):
-        if type(item) not in (int, str, np.ndarray, CRV):
+        if not isinstance(item, (int, str, np.ndarray, CRV)):
             raise Exception(f'Invalid type to be vector, was {type(item)}')
         
         if type(item) == CRV:
             return item
+
+        # a sparse row already knows which of its values are non-zero
+        if self.sparse and type(item) in (int, str):
+            row = self.dequantize(self.matrix[self.to_int(item)])
+            nonzero = row.data != 0
+            return CRV.from_arrays(self.crv_ids[row.indices[nonzero]], row.data[nonzero])
         
         item = self.to_vector(item)
-        return CRV({word : val for word, val in zip(self.embedding_vocab, item) if val != 0})
+        nonzero = np.flatnonzero(item)
+        return CRV.from_arrays(self.crv_ids[nonzero], item[nonzero])
     
 
     # Vector Creation
@@ -90,69 +274,254 @@ class Vectorizer:
         return result
 
     def average(self, *args):
-        if len(args) == 0 and type(args[0]) == list:
+        if len(args) == 1 and type(args[0]) == list:
             args = args[0]
-        result = np.zeros(self.csize)
-        for arg in args:
-            result += self.to_vector(arg)
 
-        return result / len(args)
+        # words are averaged straight from their rows of the matrix
+        if all(type(arg) in (int, str) for arg in args):
+            rows = self.dequantize(self.matrix[[self.to_int(arg) for arg in args]])
+            return np.asarray(rows.mean(axis = 0)).ravel()
+
+        return np.sum([self.to_vector(arg) for arg in args], axis = 0) / len(args)
     
 
     # Different methods of comparison of a word to all others
     def rate_words(self, vector, mode = 'min'):
         vector = self.to_vector(vector)
+        ratings = self.rate_rows(self.matrix, vector, mode)
+            
+        return sort_hl({word : i for word, i in zip(self.vocab, list(ratings))})
+
+    # rate many words / vectors at once, keeping only the k best rated words for each
+    # - the matrix is rated chunk_size rows at a time, so the temporary arrays stay chunk_size x csize
+    # - each chunk only keeps its top k (a partial selection, not a full sort)
+    # - with workers > 1 the chunks are rated in a thread pool
+    # returns (indices, scores) arrays with a row per query, best first (self.vocab[i] gives the word),
+    # or just one row of each for a single query
+    def rate_words_batch(self, queries, k = 20, mode = 'min', chunk_size = 256, workers = None):
+        single = type(queries) not in (tuple, list)
+        vectors = np.array([self.to_vector(query) for query in ([queries] if single else queries)]).reshape(-1, self.csize)
+        matrix = self.matrix
+        k = min(k, self.vsize)
+
+        def rate_chunk(start):
+            scores = self.rate_rows_batch(matrix[start : start + chunk_size], vectors, mode)
+            return top_k(scores, k, np.arange(start, start + scores.shape[1]))
+
+        starts = range(0, self.vsize, chunk_size)
+        if workers is not None and workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                indices, scores = merge_top_k(executor.map(rate_chunk, starts), k)
+        else:
+            indices, scores = merge_top_k(map(rate_chunk, starts), k)
+
+        return (indices[0], scores[0]) if single else (indices, scores)
+
+    # every pair of words that rate >= threshold against each other, as a sparse (vsize x vsize) csr matrix
+    # of their ratings; a word is never paired with itself
+    # - words are rated block_size x block_size at a time, and only blocks on or above the diagonal
+    #   are rated, since every mode rates a against b the same as b against a
+    # - only ratings over the threshold are kept, so memory follows the number of pairs instead of vsize^2
+    # - with workers > 1 the rows of blocks are rated in a thread pool
+    def similarity_graph(self, threshold = 0.6, mode = 'sqrt', block_size = 512, workers = None):
+        matrix = self.matrix
 
+        # with no negative values sqrt(a * b) is sqrt(a) * sqrt(b), so sqrt is a product of square roots
+        # (a quantized matrix is turned back into floats for these)
+        product_matrix = None
+        if mode == 'mult':
+            product_matrix = self.dequantize(matrix)
+        elif mode == 'sqrt' and (matrix.min() if self.sparse else np.min(matrix)) >= 0:
+            product_matrix = self.dequantize(matrix)
+            product_matrix = product_matrix.sqrt() if self.sparse else np.sqrt(product_matrix)
+
+        def rate_block_row(start):
+            end = min(start + block_size, self.vsize)
+            pairs = []
+
+            for block_start in range(start, self.vsize, block_size):
+                block_end = min(block_start + block_size, self.vsize)
+
+                if product_matrix is not None:
+                    ratings = product_matrix[start : end] @ product_matrix[block_start : block_end].T
+                    ratings = ratings.toarray() if scipy.sparse.issparse(ratings) else np.asarray(ratings)
+                    if mode == 'sqrt':
+                        ratings *= ratings
+                else:
+                    vectors = self.dequantize(matrix[start : end])
+                    vectors = vectors.toarray() if self.sparse else vectors
+                    ratings = self.rate_rows_batch(matrix[block_start : block_end], vectors, mode)
+
+                rows, columns = np.nonzero(ratings >= threshold)
+                rows, columns = rows + start, columns + block_start
+
+                # on the diagonal, each pair is only kept once
+                keep = rows < columns
+                pairs.append((rows[keep], columns[keep], ratings[rows[keep] - start, columns[keep] - block_start]))
+
+            return pairs
+
+        starts = range(0, self.vsize, block_size)
+        if workers is not None and workers > 1:
+            with ThreadPoolExecutor(workers) as executor:
+                pairs = list(chain.from_iterable(executor.map(rate_block_row, starts)))
+        else:
+            pairs = list(chain.from_iterable(map(rate_block_row, starts)))
+
+        rows, columns, ratings = (np.concatenate([np.zeros(0, dtype = dtype)] + [pair[i] for pair in pairs])
+                                  for i, dtype in enumerate((np.int64, np.int64, np.float64)))
+
+        graph = scipy.sparse.coo_matrix((np.concatenate([ratings, ratings]), (np.concatenate([rows, columns]), np.concatenate([columns, rows]))),
+                                        shape = (self.vsize, self.vsize))
+        return graph.tocsr()
+
+    # rate every row of a matrix against several vectors, as a (vectors x rows) array
+    # a dense matrix is only rated on the columns where a vector isn't zero, the other columns
+    # rate the same for every vector, so their share comes from row totals worked out once per matrix
+    def rate_rows_batch(self, rows, vectors, mode = 'min'):
+        if self.is_quantized(rows):
+            return np.array([self.rate_rows(rows, vector, mode) for vector in vectors]).reshape(len(vectors), rows.shape[0])
+        if mode == 'mult':
+            return np.asarray((rows @ vectors.T).T)
+        if scipy.sparse.issparse(rows):
+            return np.array([self.rate_sparse_rows(rows, vector, mode) for vector in vectors]).reshape(len(vectors), rows.shape[0])
+
+        # at a zero in the vector: min is min(value, 0), diff is abs(value), and the other modes are 0
         if mode == 'min':
-            ratings = np.sum(np.minimum(self.matrix, vector), axis = 1)
+            negative_totals = np.minimum(rows, 0).sum(axis = 1)
+            has_negatives = np.any(negative_totals)
         elif mode == 'diff':
-            ratings = 1 - np.sum(abs(self.matrix - vector), axis = 1)
+            abs_totals = abs(rows).sum(axis = 1)
+
+        ratings = np.empty((len(vectors), rows.shape[0]))
+        for i, vector in enumerate(vectors):
+            support = np.flatnonzero(vector)
+            columns = rows[:, support]
+            ratings[i] = self.rate_rows(columns, vector[support], mode)
+
+            if mode == 'min' and has_negatives:
+                ratings[i] += negative_totals - np.minimum(columns, 0).sum(axis = 1)
+            elif mode == 'diff':
+                ratings[i] -= abs_totals - abs(columns).sum(axis = 1)
+
+        return ratings
+
+    # rate every row of a (dense or sparse) matrix against a vector
+    def rate_rows(self, rows, vector, mode = 'min'):
+        if self.is_quantized(rows):
+            return self.rate_quantized_rows(rows, vector, mode)
+        if scipy.sparse.issparse(rows):
+            return self.rate_sparse_rows(rows, vector, mode)
+
+        if mode == 'min':
+            ratings = np.sum(np.minimum(rows, vector), axis = 1)
+        elif mode == 'diff':
+            ratings = 1 - np.sum(abs(rows - vector), axis = 1)
         elif mode == 'mult':
-            ratings = np.einsum('wv,v->w', self.matrix, vector)
+            ratings = np.einsum('wv,v->w', rows, vector)
         elif mode == 'min/max':
-            max_vals = np.maximum(self.matrix, vector) 
-            ratings = np.divide(np.minimum(self.matrix, vector), max_vals, out = np.zeros_like(max_vals), where = max_vals!=0)
+            max_vals = np.maximum(rows, vector) 
+            ratings = np.divide(np.minimum(rows, vector), max_vals, out = np.zeros_like(max_vals), where = max_vals!=0)
             ratings = np.sum(ratings, axis = 1)
         elif mode == 'sqrt':
-            ratings = np.sqrt(self.matrix * vector)
+            ratings = np.sqrt(rows * vector)
             ratings = np.sum(ratings, axis = -1)
             ratings *= ratings
-            
-        return sort_hl({word : i for word, i in zip(self.vocab, list(ratings))})
+        else:
+            raise Exception(f'Invalid rating mode {mode}')
+
+        return ratings
+
+    # the same ratings, for rows of a quantized matrix
+    # 'min' and 'diff' quantize the vector the same way and compare the stored values directly
+    # (min(a, b) is the same for any b above every stored value, so a vector too big to store is capped for 'min');
+    # other modes, and vectors with negative values, are rated on the rows turned back into floats
+    def rate_quantized_rows(self, rows, vector, mode = 'min'):
+        fits = not is_fixed_point(self.quantization) or mode == 'min' or \
+               np.max(vector, initial = 0) <= self.scale * np.iinfo(get_quantized_dtype(self.quantization)).max
+
+        if mode in ('min', 'diff') and np.min(vector, initial = 0) >= 0 and fits:
+            query = quantize_values(vector, self.quantization, self.scale)
+            return rate_quantized_rows(rows, query, mode, self.scale)
+
+        return self.rate_rows(self.dequantize(rows), vector, mode)
+
+    # the same ratings, computed only over the stored values of a csr matrix.
+    # for min and diff the columns a row doesn't store (zeros) still count, so their share is added back
+    # from the vector alone; for the other modes a zero in the matrix always rates 0
+    def rate_sparse_rows(self, rows, vector, mode = 'min'):
+        values = rows.data
+        nearby = vector[rows.indices]
+        row_ids = np.repeat(np.arange(rows.shape[0]), np.diff(rows.indptr))
+
+        def row_sums(per_value):
+            return np.bincount(row_ids, weights = per_value, minlength = rows.shape[0])
+
+        if mode == 'min':
+            zero_rating = np.minimum(vector, 0)
+            ratings = row_sums(np.minimum(values, nearby) - np.minimum(nearby, 0)) + np.sum(zero_rating)
+        elif mode == 'diff':
+            ratings = 1 - (row_sums(abs(values - nearby) - abs(nearby)) + np.sum(abs(vector)))
+        elif mode == 'mult':
+            ratings = rows @ vector
+        elif mode == 'min/max':
+            max_vals = np.maximum(values, nearby)
+            ratings = np.divide(np.minimum(values, nearby), max_vals, out = np.zeros_like(max_vals), where = max_vals!=0)
+            ratings = row_sums(ratings)
+        elif mode == 'sqrt':
+            ratings = row_sums(np.sqrt(values * nearby))
+            ratings *= ratings
+        else:
+            raise Exception(f'Invalid rating mode {mode}')
+
+        return ratings
     
     # Different methods of comparison of a word to a sequence of words
     # return values should be printed with print_scanned_text()
     def rate_sequence(self, vector, word_sequence, mode = 'min'):
-        vector = self.to_vector(vector)
-        sequence = self.vectorize(word_sequence)
+        ids = np.array([self.to_int(word) for word in word_sequence], dtype = np.int64)
+        ratings = chain.from_iterable(self.scan(ids, vector, mode))
+        return [(word, rating) for word, (_, rating) in zip(word_sequence, ratings)]
 
-        if type(sequence) == list:
-            sequence = np.array(sequence)
+    # rate every word of a text against one or more concepts, chunk_size words at a time
+    # - tokens are word ids (self.vocab[i]), as an array (or memory mapped array) or any iterable,
+    #   so texts far larger than memory can be streamed through
+    # - a word always rates the same, so each word is only rated the first time it's seen,
+    #   and every later use of it just looks its rating up
+    # - the rows of new words are gathered straight from the matrix by id into one reused buffer,
+    #   so no per-word vectors are made, and every concept is rated in the same pass over them
+    # yields a list of (word, rating) per chunk for a single concept, or a list of them per concept
+    # if concepts is a list (each can be printed with print_scanned_text())
+    def scan(self, tokens, concepts, mode = 'min', chunk_size = 1024):
+        single = type(concepts) not in (tuple, list)
+        vectors = np.array([self.to_vector(concept) for concept in ([concepts] if single else concepts)]).reshape(-1, self.csize)
 
-        try:
-            if mode == 'min':
-                ratings = np.sum(np.minimum(sequence, vector), axis = 1)
-            elif mode == 'diff':
-                ratings = 1 - np.sum(abs(sequence - vector), axis = 1)
-            elif mode == 'mult':
-                ratings = np.einsum('wv,v->w', sequence, vector)
-            elif mode == 'min/max':
-                max_vals = np.maximum(word_sequence, vector) 
-                ratings = np.divide(np.minimum(word_sequence, vector), max_vals, out = np.zeros_like(max_vals), where = max_vals!=0)
-                ratings = np.sum(ratings, axis = 1)
-            elif mode == 'sqrt':
-                ratings = np.sqrt(sequence * vector)
-                ratings = np.sum(ratings, axis = -1)
-                ratings *= ratings
-
-        except Exception as error:
-            print(type(vector), type(sequence))
-            print(sequence.shape, vector.shape)
-            print(sequence.dtype, vector.dtype)
-            raise error
-
-        return [(word, i) for word, i in zip(word_sequence, list(ratings))]
+        matrix = self.matrix
+        buffer = None if self.sparse else np.empty((chunk_size, self.csize), dtype = matrix.dtype)
+
+        ratings = np.zeros((len(vectors), self.vsize))
+        rated = np.zeros(self.vsize, dtype = bool)
+
+        for ids in iter_chunks(tokens, chunk_size):
+            new_ids = np.unique(ids[~rated[ids]])
+
+            if len(new_ids):
+                if self.sparse:
+                    rows = matrix[new_ids]
+                else:
+                    rows = np.take(matrix, new_ids, axis = 0, out = buffer[: len(new_ids)])
+
+                ratings[:, new_ids] = self.rate_rows_batch(rows, vectors, mode)
+                rated[new_ids] = True
+
+            words = [self.vocab[i] for i in ids.tolist()]
+            results = [list(zip(words, concept_ratings.tolist())) for concept_ratings in ratings[:, ids]]
+
+            yield results[0] if single else results
     
 
     def __getitem__(self, idx):
-        return self.matrix[self.to_int(idx)]
+        if self.sparse:
+            return self.dequantize(self.matrix[self.to_int(idx)]).toarray().ravel()
+        # (rows of an opened Vectorizer are memmaps, given back as plain arrays)
+        return np.asarray(self.dequantize(self.matrix[self.to_int(idx)]))
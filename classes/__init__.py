@@ -1,4 +1,9 @@
 from .utils import *
 from .crv import CRV
 from .corpus import Corpus
-from .vectorizer import Vectorizer
\ No newline at end of file
+from .vectorizer import Vectorizer
+from .crvcollection import CRVCollection
+from .spellcorrector import SpellCorrector
+from .lemmatizer import Lemmatizer
+from .neighborindex import NeighborIndex
+from .clustering import find_cliques, save_cliques
\ No newline at end of file